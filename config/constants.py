@@ -1,5 +1,14 @@
 TREE_SITTER_JAVA_LIB = ""
 JAVA_HOME = ""
 OPENAI_API_KEY = ""
+# Endpoint of an OpenAI-compatible server, e.g. "http://127.0.0.1:8000/v1" for src/models/stub_server.py.
+# No API key is needed with it. "" uses the OpenAI API.
+OPENAI_BASE_URL = ""
 codebase_base = "data/codebase"
 covered_info_d4j_1_2 = "data/cov"
+# Columnar copy of data/cov written by src/dataset/coverage_store.py; read first when present. "" disables it.
+covered_info_columnar = "data/cov_columnar"
+# Content-addressed parse results shared by all checkouts. Set to "" to disable.
+parse_cache_base = "data/parse_cache"
+# Replayable LLM responses, used when main.py runs with --response_cache read or readwrite.
+response_cache_path = "data/response_cache.sqlite"
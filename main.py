@@ -10,14 +10,18 @@ import json
 from config.constants import codebase_base
 from src.custom_signal import TaskMainNormalExit, TaskMainErrorExit
 from src.dataset.repo_d4j import initialize_repo
+from src.models.GPT import Model, AsyncModel
+from src.models.rate_limiter import rate_limiter
+from src.models.response_cache import response_cache, RESPONSE_CACHE_MODES
+from src.models.retry import retry_policy
+from src.models.usage import UsageTracker, roll_up_usage
 from src.task import run
 import concurrent.futures
 fail_bug_list = []
 
 
 def create_temp_directory():
-    if not os.path.exists("tmp"):
-        os.makedirs("tmp")
+    os.makedirs("tmp", exist_ok=True)
     temp_dir = tempfile.mkdtemp(dir="tmp")
     return temp_dir
 
@@ -26,7 +30,8 @@ def delete_temp_directory(temp_dir):
     shutil.rmtree(temp_dir)
 
 
-def task_main(r, temperature, model_type, bug,bug_info,codebase_path,try_count,output_dir):
+def task_main(r, temperature, model_type, bug,bug_info,codebase_path,try_count,output_dir, index_workers=1, quiet_index=False,
+              lazy_index=False, model_class=Model, context_budget=0):
 
     bug_output = os.path.join(output_dir, bug, str(try_count))
     if os.path.exists(bug_output):
@@ -44,66 +49,100 @@ def task_main(r, temperature, model_type, bug,bug_info,codebase_path,try_count,o
     # location_extraction_flag: Indicates whether location extraction validation is enabled (default=True).
     # If set to False, use -v 0 when running evaluate.py, as evaluation steps differ slightly.
     run(parsed_dir, r, temperature, model_type, bug, str(bug_output), trigger_test_info, codebase_path, trigger_test=first_trigger_test,
-        advanced_identification=True, re_check=True, partial_save=True, issue_analysis=True, review_result=True, location_extraction_flag=True)
+        advanced_identification=True, re_check=True, partial_save=True, issue_analysis=True, review_result=True, location_extraction_flag=True,
+        index_workers=index_workers, quiet_index=quiet_index, lazy_index=lazy_index,
+        trigger_tests=list(bug_info['trigger_test'].keys()), model_class=model_class, context_budget=context_budget,
+        usage=UsageTracker())
 
 
-def main(meta_path, agent_number, model_type, temperature, r, output_dir):
+def process_bug(n, bug, bug_info, r, temperature, model_type, output, output_dir, index_workers=1, quiet_index=False,
+                lazy_index=False, context_budget=0, model_class=Model):
+    temp_dir = create_temp_directory()
+    if bug not in ["Closure-63", "Closure-93", "Lang-2", "Time-21"]:
+        codebase_path = os.path.join(temp_dir, bug)
+    else:
+        codebase_path = os.path.join(codebase_base, bug)
+
+    initialize_repo(bug.split("-")[0],bug.split("-")[1],codebase_path)
+
+
+    try_count = 0
+
+    while try_count < 3:
+
+        try:
+            task_main(r-1, temperature, model_type, bug, bug_info, codebase_path, try_count, output,
+                      index_workers=index_workers, quiet_index=quiet_index, lazy_index=lazy_index,
+                      model_class=model_class, context_budget=context_budget)
+            # print(f"agent_{n}: Finish {bug}")
+            break
+
+        except TaskMainNormalExit as e:
+            print(e)
+            delete_temp_directory(temp_dir)
+            break
+        except TaskMainErrorExit as e:
+            print(e)
+            error_info = f"Error in {bug} : {e}"
+            with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
+                f.write(f"agent_{n}:" + error_info + "\n")
+            delete_temp_directory(temp_dir)
+            break
+
+        except Exception as e:
+            print(e)
+            if (("Connection error" in str(e)) or ("Request timed out" in str(e)) or ("request contained invalid JSON: Expecting value:" in str(e))) and try_count < 3:
+                time.sleep(30)
+                with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
+                    f.write(f"agent_{n}: Retry {bug}: {e}\n")
+                try_count += 1
+                if try_count == 3:
+                    delete_temp_directory(temp_dir)
+
+                continue
+            else:
+
+                bug_info = f"Error in {bug} : {e}"
+                with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
+                    f.write(f"agent_{n}:" + bug_info + "\n")
+                delete_temp_directory(temp_dir)
+                break
+    if not rate_limiter.enabled:
+        time.sleep(5)
+
+
+def main(meta_path, agent_number, model_type, temperature, r, output_dir, index_workers=1, quiet_index=False,
+         lazy_index=False, concurrency=1, response_cache_mode="off", response_cache_file=None, rpm=0, tpm=0,
+         rate_limit_file=None, max_retries=None, retry_budget=None,
+         stream_json=False, context_budget=0, base_url=None):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
+    response_cache.configure(response_cache_mode, response_cache_file)
+    rate_limiter.configure(rpm, tpm, rate_limit_file)
+    retry_policy.configure(max_retries, retry_budget)
+    Model.stream_json = stream_json
+    if base_url:
+        Model.base_url = base_url
     with open(meta_path,"r") as f:
         data = json.load(f)
+    bugs = []
     for n in range(1,agent_number+1):
         output = os.path.join(output_dir, f"agent_{n}")
         for bug, bug_info in islice(data.items(),0, None):
-            temp_dir = create_temp_directory()
-            if bug not in ["Closure-63", "Closure-93", "Lang-2", "Time-21"]:
-                codebase_path = os.path.join(temp_dir, bug)
-            else:
-                codebase_path = os.path.join(codebase_base, bug)
-
-            initialize_repo(bug.split("-")[0],bug.split("-")[1],codebase_path)
-
-
-            try_count = 0
-
-            while try_count < 3:
-
-                try:
-                    task_main(r-1, temperature, model_type, bug, bug_info, codebase_path, try_count, output)
-                    # print(f"agent_{n}: Finish {bug}")
-                    break
-
-                except TaskMainNormalExit as e:
-                    print(e)
-                    delete_temp_directory(temp_dir)
-                    break
-                except TaskMainErrorExit as e:
-                    print(e)
-                    error_info = f"Error in {bug} : {e}"
-                    with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
-                        f.write(f"agent_{n}:" + error_info + "\n")
-                    delete_temp_directory(temp_dir)
-                    break
-
-                except Exception as e:
-                    print(e)
-                    if (("Connection error" in str(e)) or ("Request timed out" in str(e)) or ("request contained invalid JSON: Expecting value:" in str(e))) and try_count < 3:
-                        time.sleep(30)
-                        with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
-                            f.write(f"agent_{n}: Retry {bug}: {e}\n")
-                        try_count += 1
-                        if try_count == 3:
-                            delete_temp_directory(temp_dir)
-
-                        continue
-                    else:
-
-                        bug_info = f"Error in {bug} : {e}"
-                        with open(os.path.join(output_dir, "fail_bug_list.txt"), "a+") as f:
-                            f.write(f"agent_{n}:" + bug_info + "\n")
-                        delete_temp_directory(temp_dir)
-                        break
-            time.sleep(5)
+            bugs.append((n, bug, bug_info, r, temperature, model_type, output, output_dir, index_workers, quiet_index,
+                         lazy_index, context_budget))
+    if concurrency > 1:
+        # Each bug runs in its own thread; their model requests share the AsyncModel event loop.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(process_bug, *args, model_class=AsyncModel) for args in bugs]
+            for future in futures:
+                future.result()
+    else:
+        for args in bugs:
+            process_bug(*args)
+    total = roll_up_usage(output_dir)["total"]
+    print(f"Run usage: {total['input_tokens']} input tokens ({total['cached_tokens']} cached), "
+          f"{total['output_tokens']} output tokens in {total['calls']} calls.")
 
 
 if __name__ == "__main__":
@@ -114,10 +153,36 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--temperature", type=float, default=0.2, help="Model temperature (default is 0.2)")
     parser.add_argument("-l", "--upper_limit", type=int, default=10, help="Upper limit for tool invocation (default is 10)")
     parser.add_argument("-o", "--output_dir", type=str, required=True, help="Output directory for results")
+    parser.add_argument("-w", "--index_workers", type=int, default=1, help="Number of processes used to parse the codebase (default is 1)")
+    parser.add_argument("-q", "--quiet_index", action="store_true", help="Report indexing progress periodically instead of per file")
+    parser.add_argument("-z", "--lazy_index", action="store_true", help="Parse only the covered files up front and the rest on demand")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="Number of bugs processed at the same time (default is 1)")
+    parser.add_argument("--response_cache", type=str, default="off", choices=RESPONSE_CACHE_MODES,
+                        help="Replay stored LLM responses (read) and also store new ones (readwrite) (default is off)")
+    parser.add_argument("--response_cache_file", type=str, default=None, help="sqlite file of the response cache")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute allowed by the API quota (default is 0, no limit)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute allowed by the API quota (default is 0, no limit)")
+    parser.add_argument("--rate_limit_file", type=str, default=None,
+                        help="State file shared by every process that draws from the same quota")
+    parser.add_argument("--max_retries", type=int, default=None, help="Retries of a failed LLM request (default is 5)")
+    parser.add_argument("--retry_budget", type=float, default=None,
+                        help="Seconds after which a failing LLM request is no longer retried (default is 300)")
+    parser.add_argument("--stream_json", action="store_true",
+                        help="Stream JSON-mode responses and stop reading once the JSON object is complete")
+    parser.add_argument("-b", "--context_budget", type=int, default=0,
+                        help="Tokens of tool outputs resent with each call; older outputs are stubbed (default is 0, keep all)")
+    parser.add_argument("--base_url", type=str, default=None,
+                        help="OpenAI-compatible endpoint to use instead of the OpenAI API, e.g. the local stand-in "
+                             "of src/models/stub_server.py at http://127.0.0.1:8000/v1")
     args = parser.parse_args()
     meta_path = "data/meta/Defects4J-v-1-2.json"
 
-    main(meta_path, args.agent_number, args.model_type, args.temperature, args.upper_limit, args.output_dir)
+    main(meta_path, args.agent_number, args.model_type, args.temperature, args.upper_limit, args.output_dir,
+         index_workers=args.index_workers, quiet_index=args.quiet_index, lazy_index=args.lazy_index,
+         concurrency=args.concurrency, response_cache_mode=args.response_cache,
+         response_cache_file=args.response_cache_file, rpm=args.rpm, tpm=args.tpm,
+         rate_limit_file=args.rate_limit_file, max_retries=args.max_retries, retry_budget=args.retry_budget,
+         stream_json=args.stream_json, context_budget=args.context_budget, base_url=args.base_url)
 
 
 
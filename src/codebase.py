@@ -1,31 +1,31 @@
 from tree_sitter import Language, Parser
-import json
 import os
 
+from src.dataset.coverage_store import read_class_lines
 from src.dataset.repo_d4j import recognize_pattern
-from src.tools.auxiliary import find_target_and_comments, extract_children_from_class, extract_inheritance_info, \
+from src.coverage import CoverageStore, CoveredEntityTable, CoverageMatrix
+from src.parse.binary_index import BinaryIndex, entity_rows
+from src.parse.parse_repo import index_java_file, list_java_files, new_parser
+from src.record import print_and_log
+from src.tools.auxiliary import extract_children_from_class, extract_inheritance_info, \
     extract_imports, extract_innerclass_from_class, \
-    extract_info_from_innerclass, extract_signature_changed, find_method_node
+    extract_info_from_innerclass, parsed_files, detect_file_encoding, remember_encoding, clean_comment
 from typing import List, Dict
 import re
-from config.constants import TREE_SITTER_JAVA_LIB, covered_info_d4j_1_2
+from config.constants import TREE_SITTER_JAVA_LIB
 from src.tools.auxiliary_tools import _get_package_name, _get_imports
-import chardet
+from src.tools.utils import PathSuffixTrie
 
 JAVA_LANGUAGE = Language(TREE_SITTER_JAVA_LIB, 'java')
 method_upper_bound = 50
+suspicious_methods_upper_bound = 10
 files_from_dir_upper_bound = 30
 
 
-def clean_comment(comment):
-    javadoc_pattern = re.compile(r'/\*\*.*?\*/', re.DOTALL)
-    javadocs = javadoc_pattern.findall(comment)
-    javadocs_combined = "\n".join(javadocs)
-    return javadocs_combined
-
-
-def get_file_name(class_name, codebase_path, type):
-    proj_main_pattern, proj_test_pattern = recognize_pattern(codebase_path)
+def get_file_name(class_name, codebase_path, type, patterns=None):
+    if patterns is None:
+        patterns = recognize_pattern(codebase_path)
+    proj_main_pattern, proj_test_pattern = patterns
     if (not proj_main_pattern) or (not proj_test_pattern):
         # print_and_log("Failed to recognize the source and test folders.\n")
         return ""
@@ -43,98 +43,330 @@ def get_file_name(class_name, codebase_path, type):
         return ""
 
 
-def read_lines_from_file_with_cov(file_path, start_line, end_line, covered_lines):
-    content = []
+def read_source_lines(file_path):
+    """Lines of a source file as text-mode reading would return them, sliced from the cached file bytes."""
+    code, _ = parsed_files.get(file_path)
+    text = code.decode(detect_file_encoding(file_path)).replace('\r\n', '\n').replace('\r', '\n')
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
 
-    encoding = detect_file_encoding(file_path)
-    with open(file_path, 'r', encoding=encoding) as file:
 
-        for current_line_number, line in enumerate(file, start=1):
-            if int(start_line) <= current_line_number <= int(end_line):
-                if current_line_number in covered_lines:
-                    line = line.rstrip() + "  //**covered**\n"
-                content.append(line)
-            elif current_line_number > int(end_line):
-                break
+def read_lines_from_file_with_cov(file_path, start_line, end_line, covered_lines):
+    content = []
+    lines = read_source_lines(file_path)
+    for current_line_number in range(int(start_line), min(int(end_line), len(lines)) + 1):
+        line = lines[current_line_number - 1]
+        if current_line_number in covered_lines:
+            line = line.rstrip() + "  //**covered**\n"
+        content.append(line)
     return ''.join(content)
 
 
 class CodeBase:
     """support information extraction for code exploration tools"""
 
-    def __init__(self, codebase_path, parse_files_path):
+    def __init__(self, codebase_path, index_path):
         # source code path
         self.codebase_path = codebase_path
-        self.parse_files_path = parse_files_path
+        self.index_path = index_path
+        self.index = None
+        # lazy loading state, see load_parsed_files
+        self.parse_cache_dir = None
+        self.pending_files = set()
+        self.file_entity_trees = {}
+        self.file_order: Dict[str, int] = {}
+        self.parser = None
         self.file_classes_list: Dict[str, List[str]] = {}
-        self.classes_list: List[str] = []
+        # symbol tables, filled by load_parsed_files
+        self.class_files: Dict[str, List[str]] = {}
+        self.file_class_entities: Dict[tuple, Dict] = {}
+        self.class_methods: Dict[tuple, List[Dict]] = {}
+        self.methods_by_name: Dict[str, List[Dict]] = {}
+        self.file_methods: Dict[tuple, List[Dict]] = {}
         self.java_file_relpaths: List[str] = []
         self.extract_methods_info: List[Dict] = []
         self.extract_classes_info: List[Dict] = []
         self.possible_paths_list: List[str] = []
+        self.path_trie = PathSuffixTrie()
         # for self-check
         self.extracted_methods_list = []
-        self.covered_line_src = {}
-        self.covered_line_test = {}
+        self.covered_line_src = CoverageStore()
+        self.covered_line_test = CoverageStore()
+        # source/test folder patterns and covered class -> file, resolved once per codebase
+        self.source_patterns = None
+        # built from the coverage on first use, unless load_covered_entities loads a saved one
+        self.covered_entities = None
+        self.coverage_matrix = CoverageMatrix([], {})
+        self.coverage_matrix_src_files: List[str] = []
+        self.class_file_names: Dict[tuple, str] = {}
 
     def clean_info(self, file, info):
         cleaned_info = []
         for element in info:
             start_line = element["start_line"]
             end_line = element["end_line"]
-            number_list = self.get_covered_lines(file, start_line, end_line)
-            if number_list:
+            if self.is_covered(file, start_line, end_line):
                 cleaned_info.append(element)
 
         return cleaned_info
 
     def read_covered_info(self, project, bug_id, trigger_test):
-        target_covered_info = os.path.join(covered_info_d4j_1_2, project + "_" + str(bug_id))
-        src_cov_path = os.path.join(target_covered_info, "src_cov", trigger_test)
-        test_cov_path = os.path.join(target_covered_info, "test_cov", trigger_test)
-        with open(src_cov_path, "r") as f:
-            src_cov = json.load(f)
-        with open(test_cov_path, "r") as f:
-            test_cov = json.load(f)
-        for element in src_cov:
-            class_name = element["class_name"].strip()
-            file_name = get_file_name(class_name, self.codebase_path, type="main")
-            file_name = file_name.strip()
-            file_name += ".java"
+        src_lines = {}
+        test_lines = {}
+        for class_name, lines in read_class_lines(project, bug_id, "src_cov", trigger_test).items():
+            file_name = self.class_file_name(class_name, "main")
             if not file_name:
                 continue
-            line_number = element["line_number"]
-            if file_name not in self.covered_line_src:
-                self.covered_line_src[file_name] = [int(line_number)]
-            else:
-                self.covered_line_src[file_name].append(int(line_number))
-        for element in test_cov:
-            class_name = element["class_name"].strip()
-            file_name = get_file_name(class_name, self.codebase_path, type="test")
-            file_name = file_name.strip()
-            file_name += ".java"
+            src_lines.setdefault(file_name, []).extend(lines)
+        for class_name, lines in read_class_lines(project, bug_id, "test_cov", trigger_test).items():
+            file_name = self.class_file_name(class_name, "test")
             if not file_name:
                 continue
-            line_number = element["line_number"]
-            if file_name not in self.covered_line_test:
-                self.covered_line_test[file_name] = [int(line_number)]
-            else:
-                self.covered_line_test[file_name].append(int(line_number))
+            test_lines.setdefault(file_name, []).extend(lines)
+        self.covered_line_src = CoverageStore(src_lines)
+        self.covered_line_test = CoverageStore(test_lines)
+        self.covered_entities = None
+
+    def read_trigger_tests_coverage(self, project, bug_id, trigger_tests):
+        """Load the coverage of all failing tests of the bug into `coverage_matrix`.
+
+        Tests without recorded coverage are left out. The single-test coverage of `read_covered_info`,
+        which the tools report by default, is not affected.
+        """
+        tests = []
+        per_test_files = []
+        src_files = {}
+        for trigger_test in trigger_tests:
+            try:
+                class_lines = [(type, read_class_lines(project, bug_id, kind, trigger_test))
+                               for kind, type in (("src_cov", "main"), ("test_cov", "test"))]
+            except FileNotFoundError:
+                print_and_log(f"No coverage recorded for {trigger_test}.")
+                continue
+            files = {}
+            for type, lines_by_class in class_lines:
+                for class_name, lines in lines_by_class.items():
+                    file_name = self.class_file_name(class_name, type)
+                    if file_name:
+                        files.setdefault(file_name, []).extend(lines)
+                        if type == "main":
+                            src_files.setdefault(file_name, None)
+            tests.append(trigger_test)
+            per_test_files.append(files)
+        all_files = {}
+        for files in per_test_files:
+            for file_name in files:
+                all_files.setdefault(file_name, None)
+        self.coverage_matrix = CoverageMatrix(tests, {file_name: [files.get(file_name, []) for files in per_test_files]
+                                                      for file_name in all_files})
+        self.coverage_matrix_src_files = list(src_files)
+
+    def lines_covered_by_all_tests(self, file_path, start_line, end_line):
+        return self.coverage_matrix.intersection(file_path, start_line, end_line).tolist()
+
+    def suspicious_methods(self, formula="ochiai"):
+        """Rank the covered source methods and constructors by spectrum-based suspiciousness.
+
+        A method scores as its most suspicious line. Returns dicts sorted from the most suspicious, with ties
+        broken by the number of failing tests covering the method.
+        """
+        ranked = []
+        for file in self.coverage_matrix_src_files:
+            # covered classes that do not live in a file of their own name (package-private top-level
+            # classes, generated sources) are not in the index
+            if file not in self.file_order:
+                continue
+            lines, scores = self.coverage_matrix.suspiciousness(file, formula)
+            if not len(lines):
+                continue
+            rows = self.file_entity_rows(file)
+            for entity_type, name, start_line, end_line, parent, _, _, signature, _ in rows:
+                if entity_type not in ("method", "constructor"):
+                    continue
+                start, end = lines.searchsorted([start_line, end_line + 1])
+                if start == end:
+                    continue
+                method = {"file": file, "type": entity_type, "name": name, "signature": signature,
+                          "start_line": start_line, "end_line": end_line, "score": float(scores[start:end].max()),
+                          "failing_tests": self.coverage_matrix.tests_covering(file, start_line, end_line)}
+                if parent != -1:
+                    method["parent_type"], method["parent_name"] = rows[parent][:2]
+                ranked.append(method)
+        ranked.sort(key=lambda m: (-m["score"], -m["failing_tests"]))
+        return ranked
+
+    def get_suspicious_methods(self, top_n=suspicious_methods_upper_bound, formula="ochiai") -> str:
+        """Implementation of the tool `get_suspicious_methods`."""
+
+        message = "Result of get_suspicious_methods():\n"
+        ranked = self.suspicious_methods(formula)
+        if not ranked:
+            return message + "No covered method was found."
+        top_n = max(1, min(int(top_n), suspicious_methods_upper_bound))
+        total_tests = len(self.coverage_matrix.tests)
+        for index, item in enumerate(ranked[:top_n]):
+            message += f'({index + 1}) <file>{item["file"]}</file>'
+            if item.get("parent_type") and item.get("parent_name"):
+                message += f' <{item["parent_type"]}>{item["parent_name"]}</{item["parent_type"]}>'
+            message += f' <method_signature>{item["signature"]}</method_signature>'
+            message += f' score: {item["score"]:.4f}, covered by {item["failing_tests"]} of {total_tests} failing tests\n'
+        if len(ranked) > top_n:
+            message += f"Only the {top_n} most suspicious of {len(ranked)} covered methods are shown.\n"
+        return message
+
+    def class_file_name(self, class_name, type):
+        """Relative path of the file declaring a covered class, or "" if the source folders are unknown."""
+        key = (class_name, type)
+        file_name = self.class_file_names.get(key)
+        if file_name is None:
+            if self.source_patterns is None:
+                self.source_patterns = recognize_pattern(self.codebase_path)
+            file_name = get_file_name(class_name.strip(), self.codebase_path, type, self.source_patterns).strip()
+            if file_name:
+                file_name += ".java"
+            self.class_file_names[key] = file_name
+        return file_name
+
+    def load_covered_entities(self, table_path=None):
+        """Build the table of covered classes and methods from the loaded index and coverage, or load it from
+        `table_path` if an earlier run saved it there from the same coverage and entity ranges."""
+        coverage_stores = [self.covered_line_src, self.covered_line_test]
+        # covered classes can resolve to files missing from the checkout; those are not listed
+        covered_files = [file for file in self.java_file_relpaths
+                         if file in self.covered_line_src or file in self.covered_line_test]
+        file_rows = [(file, self.file_entity_rows(file)) for file in covered_files]
+        if table_path:
+            saved = CoveredEntityTable.load(table_path)
+            if saved is not None and saved.fingerprint == CoveredEntityTable.compute_fingerprint(file_rows,
+                                                                                                 coverage_stores):
+                self.covered_entities = saved
+                return
+        self.covered_entities = CoveredEntityTable.build(file_rows, coverage_stores)
+        if table_path:
+            self.covered_entities.save(table_path)
+
+    def covered_entity_table(self):
+        if self.covered_entities is None:
+            self.load_covered_entities()
+        return self.covered_entities
+
+    def file_entity_rows(self, file):
+        if self.index is None:
+            self.index_files([file])
+            return entity_rows(self.file_entity_trees[file])
+        return self.index.file_entity_rows(file)
 
     def get_extracted_methods_list(self):
         return self.extracted_methods_list
 
-    def load_parsed_files(self, summary_json):
-        with open(summary_json, 'r') as f:
-            data = json.load(f)
-            self.java_file_relpaths = data.keys()
-            self.file_classes_list = data
-
-        # extract classes from file_classes_list
-        for class_list in self.file_classes_list.values():
-            for c in class_list:
-                self.classes_list.append(c)
-
+    def load_parsed_files(self, lazy=False, cache_dir=None):
+        """Load the symbol tables of the codebase.
+
+        By default they come from the binary index at `index_path`. With `lazy`, no index is needed: only
+        the files in the loaded coverage are parsed now (through the parse cache in `cache_dir`), a file is
+        parsed on its first direct access, and a lookup that finds nothing indexes the remaining files
+        before it answers. Call `read_covered_info` first in that mode.
+        """
+        if not lazy:
+            self.index = BinaryIndex(self.index_path)
+            self.java_file_relpaths = self.index.file_paths
+            self.path_trie = PathSuffixTrie(self.java_file_relpaths)
+            self.file_order = {file: i for i, file in enumerate(self.java_file_relpaths)}
+            for key, encoding in self.index.content_encodings():
+                remember_encoding(key, encoding)
+            for file in self.java_file_relpaths:
+                self._add_file_to_symbols(file, self.index.file_entity_rows(file))
+            return
+
+        self.java_file_relpaths = list_java_files(self.codebase_path)
+        self.path_trie = PathSuffixTrie(self.java_file_relpaths)
+        self.file_order = {file: i for i, file in enumerate(self.java_file_relpaths)}
+        self.parse_cache_dir = cache_dir
+        self.pending_files = set(self.java_file_relpaths)
+        self.index_files([file for file in self.java_file_relpaths
+                          if file in self.covered_line_src or file in self.covered_line_test])
+
+    def index_files(self, files):
+        """Parse the given files if they were left out of a lazy load."""
+        for file in files:
+            if file not in self.pending_files:
+                continue
+            if self.parser is None:
+                self.parser = new_parser()
+            key, encoding, entities, _ = index_java_file(self.codebase_path, file, self.parser, self.parse_cache_dir)
+            remember_encoding(key, encoding)
+            self.file_entity_trees[file] = entities
+            self._add_file_to_symbols(file, entity_rows(entities))
+            self.pending_files.discard(file)
+
+    def index_remaining_files(self):
+        if self.pending_files:
+            print_and_log(f"Indexing the remaining {len(self.pending_files)} Java files.")
+            self.index_files([file for file in self.java_file_relpaths if file in self.pending_files])
+
+    def _append_in_file_order(self, table, key, item, file):
+        items = table.setdefault(key, [])
+        items.append(item)
+        # Lazily indexed files arrive out of order; keep every list in index order as a full load does.
+        if len(items) > 1 and self.file_order[file] < self.file_order[self._item_file(items[-2])]:
+            items.sort(key=lambda x: self.file_order[self._item_file(x)])
+
+    @staticmethod
+    def _item_file(item):
+        return item if isinstance(item, str) else item["file"]
+
+    def _add_file_to_symbols(self, file, rows):
+        """Register the classes and methods of one indexed file (rows as `entity_rows` returns them).
+
+        Entities are visited in pre-order and files in index order, so every list keeps the order in which
+        the former recursive searches over the entity trees returned their results.
+        """
+        self.file_classes_list[file] = [row[1] for row in rows if row[0] in ("class", "interface")]
+        for entity_type, name, start_line, end_line, parent, start_byte, end_byte, signature, comment in rows:
+            if entity_type in ("class", "interface"):
+                if (file, name) not in self.file_class_entities:
+                    self.file_class_entities[(file, name)] = {"type": entity_type, "start_line": start_line,
+                                                              "end_line": end_line, "start_byte": start_byte,
+                                                              "end_byte": end_byte, "comment": comment}
+                    self._append_in_file_order(self.class_files, name, file, file)
+                continue
+            record = {"file": file, "type": entity_type, "start_line": start_line, "end_line": end_line,
+                      "signature": signature, "comment": comment}
+            if parent != -1:
+                parent_type, parent_name = rows[parent][:2]
+                record["parent_name"] = parent_name
+                record["parent_type"] = parent_type
+                if parent_type in ("class", "interface"):
+                    self._append_in_file_order(self.class_methods, (parent_name, name), record, file)
+            self._append_in_file_order(self.methods_by_name, name, record, file)
+            self.file_methods.setdefault((file, name), []).append(record)
+
+    def lookup_class_files(self, class_name):
+        """Files declaring a class or interface. During a lazy load, files named after the class are indexed
+        first, and the whole codebase if the class is still unknown."""
+        self.index_files(self.path_trie.find(f"{class_name}.java"))
+        if class_name not in self.class_files:
+            self.index_remaining_files()
+        return self.class_files.get(class_name, [])
+
+    def lookup_class_methods(self, class_name, method_name):
+        if (class_name, method_name) not in self.class_methods:
+            self.index_remaining_files()
+        return self.class_methods.get((class_name, method_name), [])
+
+    def lookup_methods(self, method_name):
+        if method_name not in self.methods_by_name:
+            self.index_remaining_files()
+        return self.methods_by_name.get(method_name, [])
+
+    def _method_info(self, method_name, record, parent_name, parent_type):
+        """Return the `extract_methods_info` entry of an indexed method."""
+        return {"method": method_name, "file": record["file"], "start_line": record["start_line"],
+                "end_line": record["end_line"], "signature": record["signature"], "comment": record["comment"],
+                "parent_name": parent_name, "parent_type": parent_type}
 
     def construct_method_message(self, method_signature, extract_methods_info=None, jump_mode=False,
                                  extract_location=False, jump_index=0, append_to_extracted=False):
@@ -170,11 +402,10 @@ class CodeBase:
             parent_type = item.get("parent_type")
             parent_name = item.get("parent_name")
             # method_content = read_lines_from_file(target_file, start_line, end_line)
-            covered_lines = self.get_covered_lines(item["file"], start_line, end_line)
-
-            if not covered_lines:
+            if not self.is_covered(item["file"], start_line, end_line):
                 no_covered_count += 1
                 continue
+            covered_lines = self.get_covered_lines(item["file"], start_line, end_line)
 
             covered_index += 1
             if jump_mode:
@@ -211,16 +442,7 @@ class CodeBase:
 
     def find_possible_paths(self, file_path):
         self.possible_paths_list.clear()
-
-        for relpath in self.java_file_relpaths:
-            file_path_normalized = os.path.normpath(file_path)
-            relpath_normalized = os.path.normpath(relpath)
-
-            file_path_parts = file_path_normalized.split(os.sep)
-            relpath_parts = relpath_normalized.split(os.sep)
-
-            if relpath_parts[-len(file_path_parts):] == file_path_parts:
-                self.possible_paths_list.append(relpath)
+        self.possible_paths_list.extend(self.path_trie.find(file_path))
 
     def get_class_info(self, class_name: str, raw_file_path: str):
         """Implementation of the tool `get_class_info`"""
@@ -358,45 +580,11 @@ class CodeBase:
 
         self.extract_methods_info.clear()
         # case 0 cannot find class
-        if class_name not in self.classes_list:
+        if not self.lookup_class_files(class_name):
             return 0, f"Cannot find class {class_name} in the codebase."
-        candidate_files = []
-        for file, class_list in self.file_classes_list.items():
-            if class_name in class_list:
-                candidate_files.append(file)
-
-        for candidate_file in candidate_files:
-            file_path = self.transform_file_path(candidate_file)
-            with open(file_path, "r") as f:
-                data = json.load(f)
-            results = find_method_in_class(data, class_name, method_name)
-            if not results:
-                continue
-            for r in results:
-                parent_type = r["parent_type"]
-                type = r["type"]
-                flag = 0
-                if type == "constructor":
-                    flag = 2
-                method_start_line = r["start_line"]
-                method_end_line = r["end_line"]
-                out = find_target_and_comments(os.path.join(self.codebase_path, candidate_file), method_name,
-                                               method_start_line, flag)
-                encoding = detect_file_encoding(os.path.join(self.codebase_path, candidate_file))
-                method_content = out["content"]
-                method_comment = clean_comment(out["comments"])
-                node = find_method_node(os.path.join(self.codebase_path, candidate_file), method_name,
-                                        method_start_line)
-                if flag == 2:
-
-                    signature = extract_signature_changed(node, encoding=encoding)
-                else:
-                    signature = extract_signature_changed(node, encoding=encoding)
 
-                self.extract_methods_info.append(
-                    {"method": method_name, "file": candidate_file, "start_line": method_start_line,
-                     "end_line": method_end_line, "signature": signature, "comment": method_comment,
-                     "parent_name": class_name, "parent_type": parent_type})
+        for r in self.lookup_class_methods(class_name, method_name):
+            self.extract_methods_info.append(self._method_info(method_name, r, class_name, r["parent_type"]))
 
         if not self.extract_methods_info:
             # case 1 find class but cannot find method
@@ -421,41 +609,12 @@ class CodeBase:
         self.find_possible_paths(raw_file)
         if not self.possible_paths_list:
             return f"Cannot find {raw_file} in the codebase.", []
+        self.index_files(self.possible_paths_list)
 
         for file in self.possible_paths_list:
-            file_path = self.transform_file_path(file)
-            with open(file_path, "r") as f:
-                data = json.load(f)
-
-            results = find_all_methods_upgrade(data, method_name)
-            if not results:
-                continue
-            for r in results:
-                method_start_line = r["start_line"]
-                method_end_line = r["end_line"]
-                parent_name = r.get("parent_name")
-                parent_type = r.get("parent_type")
-                flag = 0
-                if r['type'] == "constructor":
-                    flag = 2
-
-                out = find_target_and_comments(os.path.join(self.codebase_path, file), method_name,
-                                               method_start_line, flag)
-
-                encoding = detect_file_encoding(os.path.join(self.codebase_path, file))
-                method_content = out["content"]
-                method_comment = clean_comment(out["comments"])
-
-                node = find_method_node(os.path.join(self.codebase_path, file), method_name,
-                                        method_start_line)
-                if flag == 2:
-                    signature = extract_signature_changed(node, encoding=encoding)
-                else:
-                    signature = extract_signature_changed(node, encoding=encoding)
+            for r in self.file_methods.get((file, method_name), []):
                 self.extract_methods_info.append(
-                    {"method": method_name, "file": file, "start_line": method_start_line, "end_line": method_end_line,
-                     "signature": signature, "comment": method_comment, "parent_name": parent_name,
-                     "parent_type": parent_type})
+                    self._method_info(method_name, r, r.get("parent_name"), r.get("parent_type")))
 
         if not self.extract_methods_info:
             return f"Cannot find method {method_name} in {raw_file}.", []
@@ -477,10 +636,8 @@ class CodeBase:
         if method_type == "name+signature":
             method_signature = method.get("signature")
         self.extract_methods_info.clear()
-        extract_methods_info = []
-        for file in self.java_file_relpaths:
-            self.extract_method_from_file({"name": method_name, "type": "name"}, file, from_codebase=True)
-            extract_methods_info.extend(self.extract_methods_info)
+        extract_methods_info = [self._method_info(method_name, r, r.get("parent_name"), r.get("parent_type"))
+                                for r in self.lookup_methods(method_name)]
 
         if not extract_methods_info:
             return f"Cannot find method {method_name} in the codebase.", []
@@ -509,13 +666,10 @@ class CodeBase:
         self.find_possible_paths(raw_file_path)
         if not self.possible_paths_list:
             return f"Cannot find {raw_file_path} in the codebase."
+        self.index_files(self.possible_paths_list)
 
-        Flag = False
-        for file_path in self.possible_paths_list:
-            for cn in self.file_classes_list[file_path]:
-                if class_name_extraction == cn:
-                    Flag = True
-                    break
+        Flag = any((file_path, class_name_extraction) in self.file_class_entities
+                   for file_path in self.possible_paths_list)
 
         imports = extract_imports(os.path.join(self.codebase_path, self.possible_paths_list[0]))
         if not Flag:
@@ -529,29 +683,17 @@ class CodeBase:
         for file_path in self.possible_paths_list:
             imports = extract_imports(os.path.join(self.codebase_path, file_path))
             package_name = _get_package_name(os.path.join(self.codebase_path, file_path))
-            file = self.transform_file_path(file_path)
             message = ""
 
-            with open(file, "r") as f:
-                data = json.load(f)
-            result = self.find_class_in_file(data, class_name_extraction)
+            result = self.file_class_entities.get((file_path, class_name_extraction))
             if not result:
                 continue
             actual_type = result["type"]
-            flag = 1
-            if actual_type == "interface":
-                # print_and_log("get_class_info_from_file meet an interface!")
-                flag = 3
             class_start_line = result["start_line"]
             class_end_line = result["end_line"]
 
-            out = find_target_and_comments(os.path.join(self.codebase_path, file_path), class_name_extraction,
-                                           class_start_line, flag)
-            class_content = out["content"]
-            class_comment = clean_comment(out["comments"])
-            encoding = detect_file_encoding(os.path.join(self.codebase_path, file_path))
-            children = extract_children_from_class(file_path, class_content, class_start_line, encoding,
-                                                   actual_type=actual_type)
+            class_content, children = self.class_children(file_path, result)
+            class_comment = result["comment"]
             extends, implements = extract_inheritance_info(class_content)
             inheritance = {}
             if extends:
@@ -586,6 +728,16 @@ class CodeBase:
 
         return message
 
+    def class_children(self, file, result):
+        """Source of the indexed class `result` of `file`, and its fields, methods and inner types with their
+        line numbers in the file."""
+        code, _ = parsed_files.get(os.path.join(self.codebase_path, file))
+        class_content = code[result["start_byte"]:result["end_byte"]]
+        encoding = detect_file_encoding(os.path.join(self.codebase_path, file))
+        # extract_children_from_class adds the shift to the 0-based rows within the class source
+        return class_content, extract_children_from_class(file, class_content, result["start_line"] - 1, encoding,
+                                                          actual_type=result["type"])
+
     def get_class_info_from_codebase(self, class_name: str) -> str:
         class_name = class_name.strip()
         # if ("." in class_name) or ("$" in class_name):
@@ -596,26 +748,13 @@ class CodeBase:
         if class_name != class_name_extraction:
             package = True
         self.extract_classes_info.clear()
-        for file in self.java_file_relpaths:
-            file_path = self.transform_file_path(file)
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-            result = self.find_class_in_file(data, class_name_extraction)
-            if not result:
-                continue
+        for file in self.lookup_class_files(class_name_extraction):
+            result = self.file_class_entities[(file, class_name_extraction)]
             actual_type = result["type"]
-            flag = 1
-            if actual_type == "interface":
-                flag = 3
             class_start_line = result["start_line"]
             class_end_line = result["end_line"]
-            out = find_target_and_comments(os.path.join(self.codebase_path, file), class_name_extraction,
-                                           class_start_line, flag)
-            class_content = out["content"]
-            class_comment = clean_comment(out["comments"])
-            encoding = detect_file_encoding(os.path.join(self.codebase_path, file))
-            children = extract_children_from_class(file_path, class_content, class_start_line, encoding,
-                                                   actual_type=actual_type)
+            class_content, children = self.class_children(file, result)
+            class_comment = result["comment"]
             extends, implements = extract_inheritance_info(class_content)
             inheritance = {}
             if extends:
@@ -817,30 +956,20 @@ class CodeBase:
         target_info = []
         find_class = False  # check whether we find the outer class
         find_interface = False
-        flag = 1
         inner_type = "class"
         outer_type = "class"
-        for file in self.java_file_relpaths:
-            file_path = self.transform_file_path(file)
-            with open(file_path, 'r') as f:
-                data = json.load(f)
-
-            result = self.find_class_in_file(data, class_name_extraction)
-            if not result:
-                continue
+        for file in self.lookup_class_files(class_name_extraction):
+            result = self.file_class_entities[(file, class_name_extraction)]
             outer_type = result["type"]
             if outer_type == "class":
                 find_class = True
-                flag = 1
             elif outer_type == "interface":
                 find_interface = True
-                flag = 3
             # print(result)
             class_start_line = result["start_line"]
             # print("this start",class_start_line)
-            out = find_target_and_comments(os.path.join(self.codebase_path, file), class_name_extraction,
-                                           class_start_line, flag)
-            class_content = out["content"]
+            code, _ = parsed_files.get(os.path.join(self.codebase_path, file))
+            class_content = code[result["start_byte"]:result["end_byte"]]
             encoding = detect_file_encoding(os.path.join(self.codebase_path, file))
             inner_class_content, inner_type, start_line, inner_class_byte_content = extract_innerclass_from_class(
                 outer_type, class_content, inner_class_name, encoding=encoding)
@@ -917,28 +1046,9 @@ class CodeBase:
         else:
             return message + f"Cannot find {class_name_extraction} in the codebase."
 
-    def recursively_find_method_start(self, data, target_method, start_line, parent_info=None):
-        for item in data:
-            if item['type'] == 'method' and (item['name'] in target_method) and item['start_line'] == start_line:
-                return {
-                    "method_info": item,
-                    "parent_info": parent_info
-                }
-            if 'children' in item and item['children']:
-                result = self.recursively_find_method_start(item['children'], target_method, start_line,
-                                                            {"type": item['type'], "name": item['name']})
-                if result:
-                    return result
-        return None
-
     def locate_method(self, file_path, start_line, end_line):
         encoding = detect_file_encoding(os.path.join(self.codebase_path, file_path))
-        with open(os.path.join(self.codebase_path, file_path), 'r', encoding=encoding) as file:
-            code = file.read()
-
-        parser = Parser()
-        parser.set_language(JAVA_LANGUAGE)
-        tree = parser.parse(bytes(code, "utf8"))
+        code, tree = parsed_files.get(os.path.join(self.codebase_path, file_path))
 
         def walk_tree(node):
             results = []
@@ -958,7 +1068,7 @@ class CodeBase:
         def extract_method_name(node, code):
             for child in node.children:
                 if child.type == 'identifier':
-                    return code[child.start_byte:child.end_byte]
+                    return code[child.start_byte:child.end_byte].decode(encoding, errors='replace')
             return "Unknown"
 
         def find_parent_class_name(node):
@@ -967,27 +1077,13 @@ class CodeBase:
                 if current.type == 'class_declaration':
                     for child in current.children:
                         if child.type == 'identifier':
-                            return code[child.start_byte:child.end_byte]
+                            return code[child.start_byte:child.end_byte].decode(encoding, errors='replace')
                 current = current.parent
             return "Unknown"
 
         results = walk_tree(tree.root_node)
         return results
 
-    def transform_file_path(self, file_path):
-        return os.path.join(self.parse_files_path, file_path[:-5] + ".json")
-
-    def find_class_in_file(self, data, class_name):
-        for item in data:
-            if (item['type'] == 'class' or item['type'] == 'interface') and item['name'] == class_name:
-                return item
-            if 'children' in item and item['children']:
-                result = self.find_class_in_file(item['children'], class_name)
-                if result:
-                    return result
-
-        return None
-
     def list_subdirectories(self, path):
         if not os.path.exists(path):
             rel_path = os.path.relpath(path, self.codebase_path)
@@ -1036,17 +1132,22 @@ class CodeBase:
         return self.possible_paths_list
 
     def get_covered_lines(self, file_path, start_line, end_line):
-        target_list = self.covered_line_src.get(file_path)
-        if not target_list:
-            target_list = self.covered_line_test.get(file_path)
-            if not target_list:
-                return []
-
-        filter_target_list = []
-        for number in target_list:
-            if start_line <= number <= end_line:
-                filter_target_list.append(number)
-        return filter_target_list
+        coverage = self.covered_line_src.get(file_path) or self.covered_line_test.get(file_path)
+        if not coverage:
+            return []
+        return coverage.lines_in_range(start_line, end_line)
+
+    def is_covered(self, file_path, start_line, end_line):
+        """Whether a method or class spanning these lines is covered, looked up in the covered entity table.
+        Only a range the table does not know (a file indexed after it was built) goes to the coverage store."""
+        count = self.covered_entity_table().covered_count(file_path, start_line, end_line)
+        if count is None:
+            return self.has_covered_lines(file_path, start_line, end_line)
+        return count > 0
+
+    def has_covered_lines(self, file_path, start_line, end_line):
+        coverage = self.covered_line_src.get(file_path) or self.covered_line_test.get(file_path)
+        return bool(coverage) and coverage.any_in_range(start_line, end_line)
 
     def iterate_inner_class(self, t_content, t_file, t_class_start, encoding='utf-8'):
         covered_methods = []
@@ -1056,8 +1157,8 @@ class CodeBase:
         for item in methods_info_list:
             start_line = item['start_line']
             end_line = item['end_line']
-            covered_lines = self.get_covered_lines(t_file, start_line, end_line)
-            if covered_lines:
+            if self.is_covered(t_file, start_line, end_line):
+                covered_lines = self.get_covered_lines(t_file, start_line, end_line)
                 self.extracted_methods_list.append({"file": t_file, "start_line": start_line, "end_line": end_line})
                 covered_methods.append(
                     {"file": t_file, "start_line": start_line, "end_line": end_line, "covered_lines": covered_lines})
@@ -1097,102 +1198,20 @@ class CodeBase:
     def clean_file_list(self, file_list):
         covered_file_list = []
         for file in file_list:
-            if (file in self.covered_line_src) or (file in self.covered_line_test):
+            if file in self.covered_entity_table().files:
                 covered_file_list.append(file)
         return covered_file_list
 
     def sort_by_line_coverage(self, file_list, upper_bound):
         file_covered_line_count = {}
+        covered_files = self.covered_entity_table().files
         for file in file_list:
-            covered_line_list = self.covered_line_src.get(file)
-            if not covered_line_list:
-                covered_line_list = self.covered_line_test.get(file)
-            if covered_line_list:
-                file_covered_line_count[file] = len(covered_line_list)
-            else:
-                file_covered_line_count[file] = 0
+            file_covered_line_count[file] = covered_files.get(file, 0)
 
         sorted_file_list = sorted(file_covered_line_count.items(), key=lambda x: x[1], reverse=True)
         return [file for file, _ in sorted_file_list[:upper_bound]]
 
 
-def detect_file_encoding(file_path):
-    with open(file_path, 'rb') as file:
-        raw_data = file.read()
-        result = chardet.detect(raw_data)
-        encoding = result['encoding']
-        # print(encoding)
-    if encoding is None:
-        encoding = 'utf-8'
-    return encoding
-
-
-
 def read_lines_from_file(file_path, start_line, end_line):
     """read a range of lines (star_line,end_line) from a file"""
-    content = []
-    encoding = detect_file_encoding(file_path)
-    with open(file_path, 'r', encoding=encoding) as file:
-        # with open(file_path, 'r', encoding='utf-8') as file:
-        for current_line_number, line in enumerate(file, start=1):
-            if int(start_line) <= current_line_number <= int(end_line):
-                content.append(line)
-            elif current_line_number > int(end_line):
-                break
-    return ''.join(content)
-
-
-def find_method_in_class(data, class_name, method_name):
-    results = []
-
-    def recursive_search(data, class_name, method_name):
-        for item in data:
-            if (item['type'] == 'class' or item['type'] == 'interface') and item['name'] == class_name:
-                for child in item['children']:
-                    if (child['type'] == 'method' and child['name'] == method_name) or (
-                            child['type'] == 'constructor' and child['name'] == method_name):
-                        results.append(
-                            {"start_line": child['start_line'], "end_line": child['end_line'], "type": child['type'],
-                             "parent_type": item['type']})
-                    if 'children' in child:
-                        recursive_search(child['children'], class_name, method_name)
-            elif 'children' in item:
-                recursive_search(item['children'], class_name, method_name)
-
-    recursive_search(data, class_name, method_name)
-    return results
-
-
-def find_all_methods(data, method_name):
-    results = []
-    for item in data:
-        if (item['type'] == 'method' or item['type'] == 'constructor') and item['name'] == method_name:
-            results.append({
-                "start_line": item['start_line'],
-                "end_line": item['end_line'],
-                "type": item['type']
-            })
-        if 'children' in item:
-            results.extend(find_all_methods(item['children'], method_name))
-    return results
-
-
-def find_all_methods_upgrade(data, method_name, parent=None):
-    results = []
-    for item in data:
-        if (item['type'] == 'method' or item['type'] == 'constructor') and item['name'] == method_name:
-            result = {
-                "start_line": item['start_line'],
-                "end_line": item['end_line'],
-                "type": item['type']
-            }
-            if parent:
-                result["parent_name"] = parent['name']
-                result["parent_type"] = parent['type']
-            results.append(result)
-        if 'children' in item:
-            results.extend(find_all_methods_upgrade(item['children'], method_name, parent=item))
-    return results
-
-
-
+    return ''.join(read_source_lines(file_path)[int(start_line) - 1:int(end_line)])
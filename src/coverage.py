@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+# Spectrum-based suspiciousness formulas over per-line counts: ef/ep are the failing/passing tests that cover
+# the line, nf/np_ the failing/passing tests that do not.
+def ochiai(ef, ep, nf, np_):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = ef / np.sqrt((ef + nf) * (ef + ep))
+    return np.nan_to_num(scores, nan=0.0)
+
+
+def dstar(ef, ep, nf, np_, star=2):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # a line covered by every failing test and no passing test scores inf
+        scores = np.power(ef, star, dtype=np.float64) / (ep + nf)
+    return np.nan_to_num(scores, nan=0.0, posinf=np.inf)
+
+
+SBFL_FORMULAS = {"ochiai": ochiai, "dstar": dstar}
+
+
+class FileCoverage:
+    """Covered lines of one file, kept as a sorted array of distinct line numbers."""
+
+    def __init__(self, lines):
+        lines = list(lines)
+        # Number of coverage records, duplicates included; files are ranked by it.
+        self.count = len(lines)
+        self.lines = array("i", sorted(set(lines)))
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, line):
+        i = bisect_left(self.lines, line)
+        return i < len(self.lines) and self.lines[i] == line
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def lines_in_range(self, start_line, end_line):
+        """Covered lines within [start_line, end_line], in ascending order."""
+        return self.lines[bisect_left(self.lines, start_line):bisect_right(self.lines, end_line)].tolist()
+
+    def count_in_range(self, start_line, end_line):
+        return max(0, bisect_right(self.lines, end_line) - bisect_left(self.lines, start_line))
+
+    def any_in_range(self, start_line, end_line):
+        """Whether any line within [start_line, end_line] is covered."""
+        i = bisect_left(self.lines, start_line)
+        return i < len(self.lines) and self.lines[i] <= end_line
+
+
+class CoverageStore:
+    """Covered lines of a test execution, keyed by relative file path."""
+
+    def __init__(self, file_lines=None):
+        self.files = {}
+        for file, lines in (file_lines or {}).items():
+            self.files[file] = FileCoverage(lines)
+
+    def __contains__(self, file):
+        return file in self.files
+
+    def __len__(self):
+        return len(self.files)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __getitem__(self, file):
+        return self.files[file]
+
+    def keys(self):
+        return self.files.keys()
+
+    def get(self, file, default=None):
+        return self.files.get(file, default)
+
+    def items(self):
+        return self.files.items()
+
+
+class CoveredEntityTable:
+    """Classes, interfaces, methods and constructors of the covered files of one failing test, with the number
+    of covered lines of each, and the coverage count of every covered file.
+
+    Built once per bug and trigger test from the entity index and the coverage, and saved as JSON so that later
+    runs, other tools and evaluation can reuse it. The table holds every entity of the indexed covered files
+    (uncovered ones with 0 lines), so it answers coverage checks for their ranges on its own. It records a
+    fingerprint of the coverage and the entity ranges it was built from; `CodeBase.load_covered_entities`
+    rebuilds a saved table whose fingerprint does not match.
+    """
+
+    def __init__(self, entities=None, files=None, fingerprint=None):
+        self.entities = entities or []
+        # covered file -> number of coverage records, as `FileCoverage.count`
+        self.files = files or {}
+        self.fingerprint = fingerprint
+        self._counts = {(e["file"], e["start_line"], e["end_line"]): e["covered_lines"] for e in self.entities}
+
+    @staticmethod
+    def compute_fingerprint(file_rows, coverage_stores):
+        """Hash of the covered lines and of the entity ranges of the covered files (`file_rows` as for `build`)."""
+        digest = hashlib.sha256()
+        for store in coverage_stores:
+            for file in sorted(store):
+                coverage = store[file]
+                digest.update(f"{file}\0{coverage.count}\0".encode("utf-8") + coverage.lines.tobytes())
+            digest.update(b"\1")
+        for file, rows in file_rows:
+            digest.update(json.dumps([file, [row[:4] for row in rows]]).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    def build(cls, file_rows, coverage_stores):
+        """`file_rows` lists (file, rows as `entity_rows` returns them) for the indexed covered files."""
+        files = {}
+        for store in reversed(coverage_stores):
+            files.update((file, coverage.count) for file, coverage in store.items())
+        entities = []
+        for file, rows in file_rows:
+            coverage = next((store.get(file) for store in coverage_stores if file in store), None)
+            if coverage is None:
+                continue
+            for entity_type, name, start_line, end_line, parent, _, _, signature, _ in rows:
+                entity = {"file": file, "type": entity_type, "name": name, "start_line": start_line,
+                          "end_line": end_line, "covered_lines": coverage.count_in_range(start_line, end_line)}
+                if signature:
+                    entity["signature"] = signature
+                if parent != -1:
+                    entity["parent_type"], entity["parent_name"] = rows[parent][:2]
+                entities.append(entity)
+        return cls(entities, files, cls.compute_fingerprint(file_rows, coverage_stores))
+
+    def covered_count(self, file, start_line, end_line):
+        """Covered lines of the entity spanning exactly these lines; 0 for a file without coverage, None if the
+        table does not know the range."""
+        if file not in self.files:
+            return 0
+        return self._counts.get((file, start_line, end_line))
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"fingerprint": self.fingerprint, "files": self.files, "entities": self.entities}, f,
+                          indent=4)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """The table saved at `path`, or None if there is none or it is unreadable."""
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            return cls(data["entities"], data["files"], data["fingerprint"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+
+class CoverageMatrix:
+    """Coverage of several failing tests: per file, a (test x line) boolean hit matrix over the lines that
+    any of the tests covers."""
+
+    def __init__(self, tests, file_lines):
+        """`file_lines` maps every file to one iterable of covered line numbers per test, in `tests` order."""
+        self.tests = list(tests)
+        self.lines = {}
+        self.hits = {}
+        for file, per_test in file_lines.items():
+            per_test = [np.asarray(list(lines), dtype=np.int32) for lines in per_test]
+            lines = np.unique(np.concatenate(per_test)) if per_test else np.empty(0, dtype=np.int32)
+            hits = np.zeros((len(self.tests), len(lines)), dtype=bool)
+            for row, test_lines in enumerate(per_test):
+                hits[row, np.searchsorted(lines, test_lines)] = True
+            self.lines[file] = lines
+            self.hits[file] = hits
+
+    def __contains__(self, file):
+        return file in self.lines
+
+    def _columns(self, file, start_line=None, end_line=None):
+        lines = self.lines[file]
+        start = 0 if start_line is None else np.searchsorted(lines, start_line, side="left")
+        end = len(lines) if end_line is None else np.searchsorted(lines, end_line, side="right")
+        return slice(start, end)
+
+    def union(self, file, start_line=None, end_line=None):
+        """Lines covered by at least one of the tests."""
+        if file not in self.lines:
+            return np.empty(0, dtype=np.int32)
+        return self.lines[file][self._columns(file, start_line, end_line)]
+
+    def intersection(self, file, start_line=None, end_line=None):
+        """Lines covered by every test."""
+        if file not in self.lines:
+            return np.empty(0, dtype=np.int32)
+        columns = self._columns(file, start_line, end_line)
+        return self.lines[file][columns][self.hits[file][:, columns].all(axis=0)]
+
+    def failing_counts(self, file, start_line=None, end_line=None):
+        """(lines, number of tests covering each line) for the lines covered by any test."""
+        if file not in self.lines:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        columns = self._columns(file, start_line, end_line)
+        return self.lines[file][columns], self.hits[file][:, columns].sum(axis=0)
+
+    def suspiciousness(self, file, formula="ochiai", passing_counts=None, total_passed=0):
+        """(lines, score of each line) for the lines covered by any test, scored by one of `SBFL_FORMULAS`.
+
+        All tests of the matrix are failing tests. Without `passing_counts` (the passing tests covering each
+        line) the spectrum has no passing side, so scores only rank lines by how many failing tests cover them.
+        """
+        lines, ef = self.failing_counts(file)
+        ef = ef.astype(np.float64)
+        ep = np.zeros_like(ef) if passing_counts is None else np.asarray(passing_counts, dtype=np.float64)
+        scores = SBFL_FORMULAS[formula](ef, ep, len(self.tests) - ef, total_passed - ep)
+        return lines, scores
+
+    def tests_covering(self, file, start_line, end_line):
+        """Number of tests that cover at least one line in the range."""
+        if file not in self.lines:
+            return 0
+        return int(self.hits[file][:, self._columns(file, start_line, end_line)].any(axis=1).sum())
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import time
+from array import array
+
+from config.constants import covered_info_d4j_1_2, covered_info_columnar
+from src.parse.binary_index import StringTable, write_columns, ColumnarFile
+
+# One file per bug holds the coverage of all its failing tests, for both the source and the test classes.
+# Every JSON entry becomes three int32 cells: the interned class name, the interned method part of `rest`
+# (everything before ":<line>") and the line number.
+COVERAGE_MAGIC = b"FLCV"
+COVERAGE_VERSION = 1
+COVERAGE_KINDS = ["src_cov", "test_cov"]
+
+
+def columnar_coverage_path(project, bug_id, columnar_dir=None):
+    return os.path.join(columnar_dir or covered_info_columnar, f"{project}_{bug_id}.cov")
+
+
+def convert_bug_coverage(bug_dir, output_path):
+    """Convert the JSON coverage of one bug (`data/cov/<Project>_<id>`) into a columnar file."""
+    strings = StringTable()
+    tests = {}
+    columns = {
+        "segment_start": array("i"),
+        "segment_count": array("i"),
+        "entry_class": array("i"),
+        "entry_method": array("i"),
+        "entry_line": array("i"),
+    }
+    for kind in COVERAGE_KINDS:
+        kind_dir = os.path.join(bug_dir, kind)
+        tests[kind] = sorted(os.listdir(kind_dir)) if os.path.isdir(kind_dir) else []
+        for test in tests[kind]:
+            with open(os.path.join(kind_dir, test), "r") as f:
+                entries = json.load(f)
+            columns["segment_start"].append(len(columns["entry_line"]))
+            columns["segment_count"].append(len(entries))
+            for element in entries:
+                line_number = int(element["line_number"])
+                method, _, line = element["rest"].rpartition(":")
+                if line != str(line_number):
+                    raise ValueError(f"Unexpected coverage entry in {os.path.join(kind_dir, test)}: {element}")
+                columns["entry_class"].append(strings.intern(element["class_name"]))
+                columns["entry_method"].append(strings.intern(method))
+                columns["entry_line"].append(line_number)
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    write_columns(output_path, COVERAGE_MAGIC, COVERAGE_VERSION, columns, strings, header={"tests": tests})
+
+
+class CoverageFile(ColumnarFile):
+    """Coverage of one bug written by `convert_bug_coverage`."""
+
+    def __init__(self, path, use_mmap=True):
+        super().__init__(path, COVERAGE_MAGIC, COVERAGE_VERSION, use_mmap=use_mmap)
+        self._segments = {}
+        for kind in COVERAGE_KINDS:
+            for test in self.header["tests"][kind]:
+                self._segments[(kind, test)] = len(self._segments)
+
+    def has_test(self, kind, test):
+        return (kind, test) in self._segments
+
+    def _segment(self, kind, test):
+        segment = self._segments[(kind, test)]
+        start = self._columns["segment_start"][segment]
+        return start, start + self._columns["segment_count"][segment]
+
+    def entries(self, kind, test):
+        """The entries of one coverage file, in the layout of the JSON source."""
+        start, end = self._segment(kind, test)
+        c = self._columns
+        return [{"class_name": self.string(c["entry_class"][i]),
+                 "rest": f"{self.string(c['entry_method'][i])}:{c['entry_line'][i]}",
+                 "line_number": str(c["entry_line"][i])} for i in range(start, end)]
+
+    def class_lines(self, kind, test):
+        """Map every covered class name to its covered line numbers, in entry order."""
+        start, end = self._segment(kind, test)
+        lines_by_id = {}
+        for class_id, line in zip(self._columns["entry_class"][start:end], self._columns["entry_line"][start:end]):
+            lines = lines_by_id.get(class_id)
+            if lines is None:
+                lines = lines_by_id[class_id] = []
+            lines.append(line)
+        return {self.string(class_id): lines for class_id, lines in lines_by_id.items()}
+
+
+def read_class_lines(project, bug_id, kind, trigger_test, use_mmap=True):
+    """Covered lines per class name for one failing test, from the columnar store if it has the bug.
+
+    Falls back to the JSON files under `covered_info_d4j_1_2`.
+    """
+    path = columnar_coverage_path(project, bug_id)
+    if covered_info_columnar and os.path.exists(path):
+        coverage = CoverageFile(path, use_mmap=use_mmap)
+        try:
+            if coverage.has_test(kind, trigger_test):
+                return coverage.class_lines(kind, trigger_test)
+        finally:
+            coverage.close()
+
+    json_path = os.path.join(covered_info_d4j_1_2, project + "_" + str(bug_id), kind, trigger_test)
+    with open(json_path, "r") as f:
+        entries = json.load(f)
+    class_lines = {}
+    for element in entries:
+        class_lines.setdefault(element["class_name"], []).append(int(element["line_number"]))
+    return class_lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the JSON coverage under data/cov into the columnar store")
+    parser.add_argument("-i", "--input_dir", type=str, default=covered_info_d4j_1_2, help="JSON coverage directory")
+    parser.add_argument("-o", "--output_dir", type=str, default=covered_info_columnar,
+                        help="Directory for the columnar coverage files")
+    parser.add_argument("-b", "--bugs", type=str, nargs="*", help="Bugs to convert, such as Lang_1 (default: all)")
+    args = parser.parse_args()
+
+    time_start = time.time()
+    bugs = args.bugs or sorted(os.listdir(args.input_dir))
+    for count, bug in enumerate(bugs, start=1):
+        convert_bug_coverage(os.path.join(args.input_dir, bug), os.path.join(args.output_dir, bug + ".cov"))
+        print(f"[{count}/{len(bugs)}] Converted {bug}")
+    print(f"Converted {len(bugs)} bugs in {time.time() - time_start:.1f} seconds.")
@@ -1,20 +1,123 @@
+from src.models.tokenizer import context_window, count_message_tokens, count_tools_tokens, tokens_per_reply
+from src.record import print_and_log
 
 
 class MessageRecord:
-    def __init__(self):
+    def __init__(self, tool_output_budget=0, model="gpt-4o-mini"):
         self.messages = []
+        # Tokens of tool outputs sent verbatim with each call; older outputs are replaced by stubs (0 keeps all).
+        self.tool_output_budget = tool_output_budget
+        self.model = model
+        # tool_call_id -> tokens its compacted output saves on each request; the same output is compacted again
+        # in every later round, so it is counted once
+        self.message_savings = {}
+        # id(message) -> (message, tokens) for the messages of the history
+        self.token_counts = {}
 
     def add_msg(self, role, content):
         self.messages.append({"role": role, "content": content})
 
+    @property
+    def tokens_saved(self):
+        return sum(self.message_savings.values())
+
     def get_msgs(self):
         return self.messages
 
+    def message_tokens(self, message, cache=True):
+        """Tokens of one message; counted once for the messages of the history (`cache`)."""
+        cached = self.token_counts.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        tokens = count_message_tokens(message, self.model)
+        if cache:
+            self.token_counts[id(message)] = (message, tokens)
+        return tokens
+
+    def count_tokens(self, messages=None, tools=None):
+        """Prompt tokens of a request with these messages (the history, or a compacted copy of it) and tools."""
+        messages = self.messages if messages is None else messages
+        tokens = 0
+        for i, msg in enumerate(messages):
+            tokens += self.message_tokens(msg, cache=i < len(self.messages) and msg is self.messages[i])
+        return tokens + count_tools_tokens(tools, self.model) + tokens_per_reply
+
+    def get_call_msgs(self, tools=None, max_tokens=1024):
+        """The messages to send with the next call.
+
+        Once the tool outputs exceed `tool_output_budget`, the oldest ones are replaced by short stubs. Then,
+        if the request would not leave `max_tokens` for the answer in the model's context window, the other
+        earlier tool outputs are stubbed as well, oldest first, and finally the outputs of the latest tool
+        round are truncated. Every tool message keeps its tool_call_id, so each tool call still has its
+        answer. `messages` itself is not changed.
+        """
+        last_round = max((i for i, msg in enumerate(self.messages) if msg.get("tool_calls")), default=-1)
+        tool_indices = [i for i, msg in enumerate(self.messages) if msg["role"] == "tool"]
+        functions = {}
+        for msg in self.messages:
+            for tool_call in msg.get("tool_calls") or []:
+                functions[tool_call["id"]] = tool_call["function"]
+        compacted = list(self.messages)
+
+        def replace(i, content):
+            tokens = self.message_tokens(compacted[i], cache=compacted[i] is self.messages[i])
+            message = {**compacted[i], "content": content}
+            new_tokens = self.message_tokens(message, cache=False)
+            if new_tokens < tokens:
+                compacted[i] = message
+                key = self.messages[i].get("tool_call_id", i)
+                self.message_savings[key] = max(self.message_savings.get(key, 0),
+                                                self.message_tokens(self.messages[i]) - new_tokens)
+                return tokens - new_tokens
+            return 0
+
+        def stub(i):
+            function = functions.get(self.messages[i]["tool_call_id"])
+            return replace(i, tool_output_stub(self.messages[i]["content"], function))
+
+        if self.tool_output_budget:
+            kept_tokens = 0
+            over_budget = False
+            for i in reversed(tool_indices):
+                tokens = self.message_tokens(self.messages[i])
+                if i > last_round or (not over_budget and kept_tokens + tokens <= self.tool_output_budget):
+                    kept_tokens += tokens
+                    continue
+                over_budget = True
+                stub(i)
+
+        limit = context_window(self.model) - max_tokens
+        total = self.count_tokens(compacted, tools)
+        if total <= limit:
+            return compacted
+        for i in tool_indices:
+            if i > last_round:
+                break
+            if compacted[i] is self.messages[i]:
+                total -= stub(i)
+                if total <= limit:
+                    break
+        latest = sorted((i for i in tool_indices if i > last_round), key=lambda i: -self.message_tokens(compacted[i]))
+        for i in latest:
+            if total <= limit:
+                break
+            content = compacted[i]["content"] or ""
+            tokens = self.message_tokens(compacted[i], cache=False)
+            keep = int(len(content) * max(0, tokens - (total - limit) - 50) / max(tokens, 1))
+            total -= replace(i, content[:keep] + "\n[... output truncated to fit the context window]")
+        if total > limit:
+            print_and_log(f"The request needs about {total} tokens, more than the {limit} available in the context "
+                          f"window of {self.model}, even after compaction.")
+        else:
+            print_and_log(f"Compacted the conversation to about {total} tokens to fit the context window.")
+        return compacted
+
     def get_last_msg(self):
         return self.messages[-1]
 
     def remove_last_msg(self):
-        self.messages.pop()
+        message = self.messages.pop()
+        self.token_counts.pop(id(message), None)
 
     def add_assistant_msg(self, message, tools_list):
         tool_dict_list = []
@@ -47,4 +150,9 @@ class MessageRecord:
         self.messages.append({"role": "tool", "content": message, "tool_call_id": tool_call_id})
 
 
-
+def tool_output_stub(content, function=None):
+    """Short stand-in for a tool output from an earlier round: the call and the first line of its result."""
+    first_line = (content or "").strip().split("\n", 1)[0]
+    call = f'{function["name"]}({function["arguments"]})' if function else "this tool call"
+    return f"[The output of {call} was shown in an earlier round and is omitted here to save context; " \
+           f"call the tool again if its details are needed. It began with: {first_line[:200]}]"
@@ -1,6 +1,6 @@
-from config.constants import OPENAI_API_KEY
+from config.constants import OPENAI_API_KEY, OPENAI_BASE_URL
 from src.record import print_and_log
-from openai import BadRequestError, OpenAI
+from openai import AsyncOpenAI, BadRequestError, OpenAI
 from openai.types.chat import (
     ChatCompletion,
     ChatCompletionMessageToolCall
@@ -8,10 +8,18 @@ from openai.types.chat import (
 from openai.types.chat.chat_completion_message_tool_call import (
     Function as OpenaiFunction,
 )
+import asyncio
 import os
 import sys
 import json
+import threading
+import time
 
+from src.models.rate_limiter import rate_limiter, estimate_tokens
+from src.models.response_cache import response_cache, request_key
+from src.models.retry import retry_policy
+from src.models.streaming import StreamCollector
+from src.models.usage import cached_prompt_tokens
 from src.tools.utils import validate_function_name
 
 # os.environ['http_proxy'] = 'http://127.0.0.1:7890'
@@ -75,14 +83,23 @@ def get_clean_func_calls(tool_calls):
 
 
 class Model:
+    # Stream JSON-mode answers and stop reading once the JSON object is complete (see src/models/streaming.py).
+    stream_json = False
+    # OpenAI-compatible endpoint to send the requests to instead of the OpenAI API.
+    base_url = OPENAI_BASE_URL
+
     def __init__(self):
         self.client = None
         self.gpt_type: str = ""
+        # time_to_first_token (streamed calls only) and latency of the last call, in seconds
+        self.last_call_metrics = {}
+        # times each request was sent, to tell the response cache a deliberate re-ask from the first ask
+        self.request_counts = {}
 
     def initial_model_config(self, gpt_type: str):
         if self.client is None:
-            if OPENAI_API_KEY:
-                self.client = OpenAI(api_key=OPENAI_API_KEY)
+            if OPENAI_API_KEY or self.base_url:
+                self.client = OpenAI(**self.client_args())
             else:
                 print("Please set your OPENAI_API_KEY in the ")
                 sys.exit(1)
@@ -95,49 +112,249 @@ class Model:
             print_and_log("The specified GPT Model is invalid.")
             sys.exit(1)
 
-    def call(self, messages, top_p=1.0, tools=None, response_format="text", temp=0.2, max_tokens=1024):
+    def client_args(self):
+        # A local endpoint does not check the key, but the client requires one.
+        return dict(api_key=OPENAI_API_KEY or "local", base_url=self.base_url or None, max_retries=0)
+
+    def request_params(self, messages, top_p=1.0, tools=None, response_format="text", temp=0.2, max_tokens=1024):
         print_and_log(
             f"parameters of this call: model = {self.gpt_type}, temperature = {temp},top_p = {top_p}, response_format = {response_format}, max_tokens={max_tokens},\n tools={tools}\n\n")
+        params = dict(
+            model=self.gpt_type,
+            messages=messages,
+            tools=tools,
+            temperature=temp,
+            response_format={"type": response_format},
+            max_tokens=max_tokens,
+            top_p=top_p,
+            stream=False,
+        )
+        if self.stream_json and response_format == "json_object" and not tools:
+            params["stream"] = True
+            params["stream_options"] = {"include_usage": True}
+        return params
+
+    @staticmethod
+    def stream_collector(params, time_start):
+        return StreamCollector(time_start, estimate_tokens(params) - int(params.get("max_tokens") or 0))
+
+    def record_metrics(self, time_start, response, collector=None, cached=False):
+        if collector is not None:
+            self.last_call_metrics = collector.metrics()
+            print_and_log(f"Streamed response: first token after {self.last_call_metrics['time_to_first_token']} s, "
+                          f"{self.last_call_metrics['latency']:.2f} s in total, early stop: {collector.early_stop}.")
+        else:
+            self.last_call_metrics = {"streamed": False, "time_to_first_token": None,
+                                      "latency": time.time() - time_start, "early_stop": False}
+        self.last_call_metrics["cached"] = cached
+        self.last_call_metrics["cached_tokens"] = cached_prompt_tokens(response.usage)
+
+    @staticmethod
+    def process_response(response: ChatCompletion, response_format="text"):
+        """Turn a completion into the tuple returned by `call`."""
+        assert response.usage is not None
+        input_tokens = int(response.usage.prompt_tokens)
+        output_tokens = int(response.usage.completion_tokens)
+        raw_response = response.choices[0].message
+        response_dict = {}
+        if response_format == "json_object":
+            try:
+                response_dict = json.loads(raw_response.content)
+            except (ValueError, TypeError):
+                response_dict = None
+
+        content = raw_response.content
+        if content is None:
+            content = ""
+        raw_tool_calls = raw_response.tool_calls
+        if raw_tool_calls:
+            raw_tool_calls = rectify_tool_calls(raw_tool_calls)
+
+        func_calls = get_clean_func_calls(raw_tool_calls)
+
+        return (
+            response_dict,
+            content,
+            raw_tool_calls,
+            func_calls,
+            input_tokens,
+            output_tokens
+        )
+
+    def cached_response(self, params):
+        """(cache key, stored completion or None) for a request; the key is None while the cache is off.
+
+        Repeats of an identical request get their own key, so a re-ask replays the answer the re-ask got.
+        """
+        if not response_cache.enabled:
+            return None, None
+        key = request_key(params)
+        attempt = self.request_counts.get(key, 0)
+        self.request_counts[key] = attempt + 1
+        key = request_key(params, attempt)
+        response = response_cache.get(key)
+        if response is not None:
+            print_and_log("Response replayed from the response cache.")
+        return key, response
+
+    @staticmethod
+    def store_response(key, response: ChatCompletion):
+        # Unusable answers are stored too: the re-ask that follows has its own key, so a replay takes the
+        # same path as the original run.
+        if key is not None:
+            response_cache.put(key, response)
+
+    @staticmethod
+    def retry_delay(retries, error, time_start):
+        """Seconds to wait before retrying a failed request, or None to raise the error."""
+        delay = retry_policy.delay(retries, error, time.time() - time_start)
+        if delay is not None:
+            print_and_log(f"Request failed ({type(error).__name__}: {error}), retry {retries + 1} in {delay:.1f} seconds.")
+        return delay
+
+    def create_completion(self, params):
+        """Send a request, retrying transient failures as `retry_policy` allows. Returns the completion and
+        the tokens reserved for it with the rate limiter."""
+        time_start = time.time()
+        retries = 0
+        while True:
+            reserved = rate_limiter.acquire(estimate_tokens(params))
+            try:
+                return self.client.chat.completions.create(**params), reserved
+            except Exception as e:
+                rate_limiter.settle(reserved, 0)
+                delay = self.retry_delay(retries, e, time_start)
+                if delay is None:
+                    raise
+                retries += 1
+                time.sleep(delay)
+
+    def start_call(self, time_start, messages, top_p, tools, response_format, temp, max_tokens):
+        """Build the request of a call. Returns its params, its response cache key, and its result when the
+        response cache already has it (None otherwise)."""
+        params = self.request_params(messages, top_p, tools, response_format, temp, max_tokens)
+        key, response = self.cached_response(params)
+        if response is None:
+            return params, key, None
+        self.record_metrics(time_start, response, cached=True)
+        return params, key, self.process_response(response, response_format)
+
+    def finish_call(self, time_start, params, key, response, collector=None):
+        """Record the metrics and the usage of a received response and return the result of the call. The
+        caller then settles its rate limiter reservation with the used tokens, `result[4] + result[5]`."""
+        if collector is not None:
+            response = collector.completion()
+        self.record_metrics(time_start, response, collector)
+        result = self.process_response(response, params["response_format"]["type"])
+        self.store_response(key, response)
+        return result
+
+    @staticmethod
+    def log_bad_request(error: BadRequestError):
+        if error.code == "context_length_exceeded":
+            print_and_log("Error: The context length has exceeded the allowed limit.")
+
+    def call(self, messages, top_p=1.0, tools=None, response_format="text", temp=0.2, max_tokens=1024):
         try:
-            response: ChatCompletion = self.client.chat.completions.create(
-                model=self.gpt_type,
-                messages=messages,
-                tools=tools,
-                temperature=temp,
-                response_format={"type": response_format},
-                max_tokens=max_tokens,
-                top_p=top_p,
-                stream=False,
-            )
-            assert response.usage is not None
-            input_tokens = int(response.usage.prompt_tokens)
-            output_tokens = int(response.usage.completion_tokens)
-            raw_response = response.choices[0].message
-            response_dict = {}
-            if response_format == "json_object":
+            time_start = time.time()
+            params, key, result = self.start_call(time_start, messages, top_p, tools, response_format, temp,
+                                                  max_tokens)
+            if result is not None:
+                return result
+            response, reserved = self.create_completion(params)
+            collector = None
+            if params["stream"]:
+                collector = self.stream_collector(params, time_start)
                 try:
-                    response_dict = json.loads(raw_response.content)
-                except (ValueError, TypeError):
-                    response_dict = None
-
-            content = raw_response.content
-            if content is None:
-                content = ""
-            raw_tool_calls = raw_response.tool_calls
-            if raw_tool_calls:
-                raw_tool_calls = rectify_tool_calls(raw_tool_calls)
-
-            func_calls = get_clean_func_calls(raw_tool_calls)
-
-            return (
-                response_dict,
-                content,
-                raw_tool_calls,
-                func_calls,
-                input_tokens,
-                output_tokens
-            )
+                    for chunk in response:
+                        if collector.add(chunk):
+                            break
+                finally:
+                    response.close()
+            result = self.finish_call(time_start, params, key, response, collector)
+            rate_limiter.settle(reserved, result[4] + result[5])
+            return result
         except BadRequestError as e:
-            if e.code == "context_length_exceeded":
-                print_and_log("Error: The context length has exceeded the allowed limit.")
+            self.log_bad_request(e)
             raise e
+
+
+_event_loop = None
+_async_client = None
+_async_lock = threading.Lock()
+
+
+def get_event_loop():
+    """The event loop that runs the requests of every `AsyncModel`, started in a daemon thread on first use."""
+    global _event_loop
+    with _async_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="model-event-loop", daemon=True).start()
+    return _event_loop
+
+
+class AsyncModel(Model):
+    """`Model` on the `AsyncOpenAI` client.
+
+    All instances share one client and one event loop, so the requests of bugs running in different threads
+    are multiplexed over a single connection pool. Async code awaits `acall`; `call` keeps the blocking
+    interface of `Model` for the synchronous pipeline and must not be used from the event loop itself.
+    """
+
+    def initial_model_config(self, gpt_type: str):
+        global _async_client
+        if self.client is None:
+            if not (OPENAI_API_KEY or self.base_url):
+                print("Please set your OPENAI_API_KEY in the ")
+                sys.exit(1)
+            with _async_lock:
+                if _async_client is None:
+                    _async_client = AsyncOpenAI(**self.client_args())
+            self.client = _async_client
+        super().initial_model_config(gpt_type)
+
+    async def acreate_completion(self, params):
+        time_start = time.time()
+        retries = 0
+        while True:
+            reserved = await rate_limiter.acquire_async(estimate_tokens(params))
+            try:
+                return await self.client.chat.completions.create(**params), reserved
+            except Exception as e:
+                await rate_limiter.settle_async(reserved, 0)
+                delay = self.retry_delay(retries, e, time_start)
+                if delay is None:
+                    raise
+                retries += 1
+                await asyncio.sleep(delay)
+
+    async def acall(self, messages, top_p=1.0, tools=None, response_format="text", temp=0.2, max_tokens=1024):
+        try:
+            time_start = time.time()
+            params, key, result = self.start_call(time_start, messages, top_p, tools, response_format, temp,
+                                                  max_tokens)
+            if result is not None:
+                return result
+            response, reserved = await self.acreate_completion(params)
+            collector = None
+            if params["stream"]:
+                collector = self.stream_collector(params, time_start)
+                try:
+                    async for chunk in response:
+                        if collector.add(chunk):
+                            break
+                finally:
+                    await response.close()
+            result = self.finish_call(time_start, params, key, response, collector)
+            await rate_limiter.settle_async(reserved, result[4] + result[5])
+            return result
+        except BadRequestError as e:
+            self.log_bad_request(e)
+            raise e
+
+    def call(self, messages, top_p=1.0, tools=None, response_format="text", temp=0.2, max_tokens=1024):
+        # The request task inherits the caller's context variables, so its log records keep the bug's tag.
+        future = asyncio.run_coroutine_threadsafe(
+            self.acall(messages, top_p, tools, response_format, temp, max_tokens), get_event_loop())
+        return future.result()
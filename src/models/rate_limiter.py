@@ -0,0 +1,129 @@
+import asyncio
+import fcntl
+import json
+import os
+import threading
+import time
+
+
+def estimate_tokens(params):
+    """Rough upper estimate of the tokens a request will use: about four characters per prompt token, plus
+    the completion budget. `RateLimiter.settle` corrects it once the real usage is known."""
+    prompt = json.dumps([params.get("messages"), params.get("tools")], ensure_ascii=False, default=str)
+    return len(prompt) // 4 + int(params.get("max_tokens") or 0)
+
+
+class RateLimiter:
+    """Token buckets for the requests-per-minute and tokens-per-minute budgets of the API.
+
+    Each bucket holds at most one minute of budget and refills continuously. A request waits until both
+    buckets can pay for it. With `state_path` the buckets live in a file locked with flock, so every process
+    pointing at the same file draws from one shared budget; threads of a process also share it.
+    A limit of 0 disables that bucket.
+    """
+
+    def __init__(self, rpm=0, tpm=0, state_path=None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = state_path
+        self._state = None
+        self._lock = threading.Lock()
+
+    def configure(self, rpm=0, tpm=0, state_path=None):
+        with self._lock:
+            self.rpm = rpm
+            self.tpm = tpm
+            self.state_path = state_path
+            self._state = None
+
+    @property
+    def enabled(self):
+        return bool(self.rpm or self.tpm)
+
+    def _refill(self, state, now):
+        elapsed = max(0.0, now - state["time"])
+        state["requests"] = min(self.rpm, state["requests"] + elapsed * self.rpm / 60)
+        state["tokens"] = min(self.tpm, state["tokens"] + elapsed * self.tpm / 60)
+        state["time"] = now
+
+    def _update(self, update):
+        """Apply `update` to the refilled bucket state and return its result."""
+        with self._lock:
+            now = time.time()
+            if not self.state_path:
+                if self._state is None:
+                    self._state = {"requests": self.rpm, "tokens": self.tpm, "time": now}
+                self._refill(self._state, now)
+                return update(self._state)
+            os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                data = f.read()
+                state = json.loads(data) if data else {"requests": self.rpm, "tokens": self.tpm, "time": now}
+                self._refill(state, now)
+                result = update(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                return result
+
+    def _try_acquire(self, tokens):
+        """Take one request and `tokens` tokens from the buckets, or return the seconds to wait first."""
+
+        def update(state):
+            waits = [0.0]
+            if self.rpm and state["requests"] < 1:
+                waits.append((1 - state["requests"]) * 60 / self.rpm)
+            if self.tpm and state["tokens"] < tokens:
+                waits.append((tokens - state["tokens"]) * 60 / self.tpm)
+            wait = max(waits)
+            if wait == 0:
+                if self.rpm:
+                    state["requests"] -= 1
+                if self.tpm:
+                    state["tokens"] -= tokens
+            return wait
+
+        return self._update(update)
+
+    def acquire(self, tokens):
+        """Block until the request can be sent, and reserve `tokens` for it."""
+        if not self.enabled:
+            return 0
+        # A request larger than a whole minute of budget waits for a full bucket instead of forever.
+        tokens = min(tokens, self.tpm)
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait == 0:
+                return tokens
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens):
+        """`acquire` for the event loop: the locked bucket update runs in a worker thread."""
+        if not self.enabled:
+            return 0
+        tokens = min(tokens, self.tpm)
+        while True:
+            wait = await asyncio.to_thread(self._try_acquire, tokens)
+            if wait == 0:
+                return tokens
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved, used):
+        """Give back or charge the difference between the reserved and the reported tokens."""
+        if not self.tpm or reserved == used:
+            return
+
+        def update(state):
+            state["tokens"] = min(self.tpm, state["tokens"] + reserved - used)
+
+        self._update(update)
+
+    async def settle_async(self, reserved, used):
+        if not self.tpm or reserved == used:
+            return
+        await asyncio.to_thread(self.settle, reserved, used)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from openai.types.chat import ChatCompletion
+
+from config.constants import response_cache_path
+
+# Total size of the stored responses; the least recently used ones are evicted beyond it.
+response_cache_bytes = 512 * 1024 * 1024
+RESPONSE_CACHE_MODES = ["off", "read", "readwrite"]
+
+
+def request_key(params, attempt=0):
+    """Hash of everything that determines a completion: model, messages, tools, temperature, top_p,
+    response_format and max_tokens. `attempt` numbers the repeats of an identical request (a re-ask after an
+    unusable answer), so that each repeat is stored and replayed as its own answer."""
+    request = {name: params.get(name) for name in
+               ["model", "messages", "tools", "temperature", "top_p", "response_format", "max_tokens"]}
+    if attempt:
+        request["attempt"] = attempt
+    encoded = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Chat completions stored in sqlite, keyed by `request_key`.
+
+    In "read" mode stored responses are replayed and nothing is written; "readwrite" also stores every new
+    response. The raw completion is kept, so a replayed call returns exactly what the original call returned,
+    token counts included.
+    """
+
+    def __init__(self, path=response_cache_path, mode="off", max_bytes=response_cache_bytes):
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def configure(self, mode, path=None, max_bytes=None):
+        if mode not in RESPONSE_CACHE_MODES:
+            raise ValueError(f"Unknown response cache mode {mode}, expected one of {RESPONSE_CACHE_MODES}")
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+            self.mode = mode
+            self.path = path or self.path
+            self.max_bytes = max_bytes or self.max_bytes
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def _connect(self):
+        if self._connection is None:
+            if self.mode == "read":
+                if not os.path.exists(self.path):
+                    return None
+                self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                                   check_same_thread=False, timeout=30)
+            else:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+                self._connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, "
+                                         "response TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+                self._connection.commit()
+                self._size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._connection
+
+    def get(self, key):
+        """The stored completion for `key`, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone() \
+                if connection else None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                connection.commit()
+        return ChatCompletion.model_validate_json(row[0])
+
+    def put(self, key, response: ChatCompletion):
+        if self.mode != "readwrite":
+            return
+        data = response.model_dump_json()
+        with self._lock:
+            connection = self._connect()
+            replaced = connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                               (key, data, len(data), time.time()))
+            self._size += len(data) - (replaced[0] if replaced else 0)
+            if self._size > self.max_bytes:
+                self._evict(connection)
+            connection.commit()
+
+    def _evict(self, connection):
+        """Delete the least recently used responses beyond `max_bytes`, and resynchronize the running size
+        (other processes may write to the same file)."""
+        total = 0
+        kept = 0
+        evicted = []
+        # The most recent response is kept even if it alone exceeds the budget.
+        for rank, (key, size) in enumerate(
+                connection.execute("SELECT key, size FROM responses ORDER BY last_used DESC")):
+            total += size
+            if total > self.max_bytes and rank > 0:
+                evicted.append((key,))
+            else:
+                kept = total
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self._size = kept
+
+    def stats(self):
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,71 @@
+import email.utils
+import random
+import time
+
+from openai import APIConnectionError, APIStatusError
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (`retry-after-ms` or `retry-after`), or None."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        return float(headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    value = headers.get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    date = email.utils.parsedate_tz(value) if value else None
+    if date is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(date) - time.time())
+
+
+class RetryPolicy:
+    """When to retry a failed request and how long to wait before doing so.
+
+    Timeouts, connection errors, rate limits (429), conflicts (409), request timeouts (408) and server errors
+    (5xx) are retried with exponential backoff and full jitter, or after the delay the server sent in
+    Retry-After. A request is given up after `max_retries` retries, or when the next attempt would start
+    more than `budget` seconds after the first one.
+    """
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0, budget=300.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+
+    def configure(self, max_retries=None, budget=None):
+        if max_retries is not None:
+            self.max_retries = max_retries
+        if budget is not None:
+            self.budget = budget
+
+    @staticmethod
+    def is_retryable(error):
+        if isinstance(error, APIConnectionError):  # includes APITimeoutError
+            return True
+        if isinstance(error, APIStatusError):
+            return error.status_code in (408, 409, 429) or error.status_code >= 500
+        return False
+
+    def delay(self, retries, error, elapsed):
+        """Seconds to wait before retry number `retries` + 1 of a request first sent `elapsed` seconds ago,
+        or None to give up."""
+        if retries >= self.max_retries or not self.is_retryable(error):
+            return None
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retries))
+        if elapsed + delay > self.budget:
+            return None
+        return delay
+
+
+retry_policy = RetryPolicy()
@@ -0,0 +1,138 @@
+import time
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.completion_usage import CompletionUsage
+
+# Content chunks accepted after the top-level JSON object has closed, waiting for the end of the stream
+# (and the usage chunk) before the rest of the stream is dropped.
+max_trailing_chunks = 8
+
+
+class JsonObjectScanner:
+    """Follow the nesting of a JSON text chunk by chunk, to tell when its top-level object is complete.
+
+    `state` is "pending" until the first significant character, "open" inside the object, "closed" once it
+    has been closed and "invalid" if the text does not start a JSON object. `end` is the length of the text
+    up to the closing brace, and `extra` tells whether anything but whitespace followed it.
+    """
+
+    def __init__(self):
+        self.state = "pending"
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.length = 0
+        self.end = None
+        self.extra = False
+
+    def feed(self, text):
+        for char in text:
+            self.length += 1
+            if self.state == "closed":
+                if not char.isspace():
+                    self.extra = True
+                    break
+            elif self.state == "pending":
+                if char.isspace():
+                    continue
+                if char != "{":
+                    self.state = "invalid"
+                    break
+                self.state = "open"
+                self.depth = 1
+            elif self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.state = "closed"
+                    self.end = self.length
+        return self.state
+
+
+class StreamCollector:
+    """Assemble the chunks of a streamed JSON-mode completion into a `ChatCompletion`.
+
+    `add` returns True once reading can stop: the answer does not start a JSON object, or the object has
+    closed and the stream keeps sending content after it (which is then dropped). Usage comes from the final
+    chunk when it was read; when the stream is cut before it, the completion tokens are counted as the
+    content chunks received and the prompt tokens are the caller's estimate.
+    """
+
+    def __init__(self, time_start, prompt_tokens_estimate):
+        self.time_start = time_start
+        self.prompt_tokens_estimate = prompt_tokens_estimate
+        self.scanner = JsonObjectScanner()
+        self.parts = []
+        self.content_chunks = 0
+        self.trailing_chunks = 0
+        self.first_token_time = None
+        self.finish_reason = None
+        self.usage = None
+        self.early_stop = False
+        self.chunk = None
+
+    def add(self, chunk: ChatCompletionChunk):
+        self.chunk = chunk
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return False
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        text = choice.delta.content
+        if not text:
+            return False
+        if self.first_token_time is None:
+            self.first_token_time = time.time()
+        self.content_chunks += 1
+        was_closed = self.scanner.state == "closed"
+        state = self.scanner.feed(text)
+        self.parts.append(text)
+        if was_closed:
+            self.trailing_chunks += 1
+        if state == "invalid" or self.scanner.extra or self.trailing_chunks > max_trailing_chunks:
+            self.early_stop = True
+            return True
+        return False
+
+    def content(self):
+        content = "".join(self.parts)
+        if self.early_stop and self.scanner.state == "closed":
+            return content[:self.scanner.end]
+        return content
+
+    def completion(self):
+        if self.usage is None:
+            self.usage = CompletionUsage(prompt_tokens=self.prompt_tokens_estimate,
+                                         completion_tokens=self.content_chunks,
+                                         total_tokens=self.prompt_tokens_estimate + self.content_chunks)
+        chunk = self.chunk
+        return ChatCompletion(
+            id=chunk.id if chunk else "",
+            object="chat.completion",
+            created=chunk.created if chunk else int(self.time_start),
+            model=chunk.model if chunk else "",
+            choices=[Choice(index=0, finish_reason=self.finish_reason or "stop",
+                            message=ChatCompletionMessage(role="assistant", content=self.content()))],
+            usage=self.usage,
+        )
+
+    def metrics(self):
+        return {
+            "streamed": True,
+            "time_to_first_token": None if self.first_token_time is None else self.first_token_time - self.time_start,
+            "latency": time.time() - self.time_start,
+            "early_stop": self.early_stop,
+        }
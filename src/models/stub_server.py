@@ -0,0 +1,290 @@
+"""A local stand-in for the chat completions endpoint, to run FaultLens without network or API key.
+
+It speaks the subset of the API that `Model` uses: tool calls, `json_object` answers, streaming with
+`include_usage`, and token usage. An answer comes from, in order:
+
+1. a recording: a response cache file written by `main.py --response_cache readwrite` (requests are matched
+   with `request_key`, counting repeats of a request the way `Model` does, so a recorded run is replayed
+   exactly);
+2. a script: a JSON list of rules, the first matching rule answers. A rule may hold `match` (regex searched
+   in the last message), `tools` (whether the request offers tools), `response_format`, and then `content`,
+   `tool_calls` (a list of {"name", "arguments"}), `latency` or `error` (an HTTP status);
+3. built-in answers that walk the pipeline once: call `get_suspicious_methods`, then propose its methods as
+   the bug locations, keep them on self-check and rank them in order.
+
+Run it with `python -m src.models.stub_server --port 8000` and point main.py at it with
+`--base_url http://127.0.0.1:8000/v1`.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.models.response_cache import ResponseCache, request_key
+from src.models.tokenizer import count_message_tokens, count_text_tokens, tokens_per_reply
+
+# Content chunks a streamed answer is split into; the latency is spread over them.
+stream_chunks = 8
+error_messages = {
+    400: "invalid_request_error",
+    408: "timeout",
+    429: "rate_limit_exceeded",
+    500: "server_error",
+    503: "server_error",
+}
+suspicious_method_pattern = re.compile(
+    r"<file>(.*?)</file>(?: <(?:class|interface|enum)>(.*?)</(?:class|interface|enum)>)?"
+    r" <method_signature>(.*?)</method_signature>")
+
+
+def last_content(messages):
+    return (messages[-1].get("content") or "") if messages else ""
+
+
+def suspicious_locations(messages):
+    """The methods listed by the last `get_suspicious_methods` output of the conversation."""
+    for message in reversed(messages):
+        content = message.get("content") or ""
+        if message.get("role") == "tool" and content.startswith("Result of get_suspicious_methods()"):
+            return [{"file": file, "class": class_name or file.split("/")[-1].split(".")[0], "method": signature,
+                     "repair_advice": "Check the logic of this method."}
+                    for file, class_name, signature in suspicious_method_pattern.findall(content)]
+    return []
+
+
+def default_answer(body):
+    """(content, tool_calls) of the built-in answer to a request."""
+    messages = body.get("messages") or []
+    if body.get("tools"):
+        if any(message.get("role") == "tool" for message in messages):
+            return "The collected information is enough to locate the bug.", []
+        return "", [{"name": "get_suspicious_methods", "arguments": {}}]
+    if (body.get("response_format") or {}).get("type") != "json_object":
+        return "The failing test exercises the methods reported above.", []
+    prompt = last_content(messages)
+    locations = suspicious_locations(messages)[:3]
+    if "ranked_methods" in prompt:
+        answer = {"ranked_methods": [{"index": i + 1, "level": i + 1} for i in range(max(1, len(locations)))]}
+    elif "reselected_bug_locations" in prompt:
+        answer = {"reselected_bug_locations": []}
+    elif '"recheck"' in prompt:
+        answer = {"recheck": [{"file": location["file"], "class": location["class"],
+                               "signature": location["method"], "buggy": True, "reason": "Covered by the failing test."}
+                              for location in locations]}
+    elif "more_suspicious_locations" in prompt:
+        answer = {"more_suspicious_locations": locations[1:]}
+    else:
+        answer = {"root_cause": "The most suspicious methods covered by the failing test.", "bug_locations": locations}
+    return json.dumps(answer), []
+
+
+class StubBackend:
+    """Choose the answer of each request and build the completion."""
+
+    def __init__(self, script=None, recording=None, latency=0.0, jitter=0.0, error_rate=0.0, error_status=500,
+                 seed=None):
+        self.rules = script or []
+        self.recording = ResponseCache(recording, "read") if recording else None
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        # times each request was seen, to replay a re-ask with the answer recorded for it
+        self.request_counts = {}
+        self._lock = threading.Lock()
+
+    def match_rule(self, body):
+        prompt = last_content(body.get("messages") or [])
+        response_format = (body.get("response_format") or {}).get("type", "text")
+        for rule in self.rules:
+            if "match" in rule and not re.search(rule["match"], prompt):
+                continue
+            if "tools" in rule and bool(rule["tools"]) != bool(body.get("tools")):
+                continue
+            if "response_format" in rule and rule["response_format"] != response_format:
+                continue
+            return rule
+        return None
+
+    def delay(self, rule):
+        latency = rule.get("latency", self.latency) if rule else self.latency
+        with self._lock:
+            return max(0.0, latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def injected_error(self, rule):
+        """HTTP status of the error to answer with, or None."""
+        with self._lock:
+            self.requests += 1
+            if rule and rule.get("error"):
+                status = rule["error"]
+            elif self.error_rate and self.random.random() < self.error_rate:
+                status = self.error_status
+            else:
+                return None
+            self.errors += 1
+            return status
+
+    def completion(self, body, rule):
+        """The completion for `body` as a dict."""
+        if self.recording is not None:
+            key = request_key(body)
+            with self._lock:
+                attempt = self.request_counts.get(key, 0)
+                self.request_counts[key] = attempt + 1
+            recorded = self.recording.get(request_key(body, attempt))
+            if recorded is not None:
+                return recorded.model_dump(exclude_none=True)
+        if rule is not None:
+            content, tool_calls = rule.get("content", ""), rule.get("tool_calls", [])
+        else:
+            content, tool_calls = default_answer(body)
+        model = body.get("model", "")
+        message = {"role": "assistant", "content": content or None}
+        completion_tokens = count_text_tokens(content, model)
+        if tool_calls:
+            message["tool_calls"] = []
+            for tool_call in tool_calls:
+                arguments = tool_call.get("arguments", {})
+                if not isinstance(arguments, str):
+                    arguments = json.dumps(arguments)
+                message["tool_calls"].append({"id": f"call_{uuid.uuid4().hex[:24]}", "type": "function",
+                                              "function": {"name": tool_call["name"], "arguments": arguments}})
+                completion_tokens += count_text_tokens(tool_call["name"] + arguments, model)
+        prompt_tokens = tokens_per_reply + sum(count_message_tokens(message, model)
+                                               for message in body.get("messages") or [])
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if tool_calls else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data, headers=None):
+        encoded = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self.send_json(200, {"object": "list", "data": []})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        backend: StubBackend = self.server.backend
+        rule = backend.match_rule(body)
+        delay = backend.delay(rule)
+        status = backend.injected_error(rule)
+        if status is not None:
+            time.sleep(delay)
+            error_type = error_messages.get(status, "server_error")
+            self.send_json(status, {"error": {"message": f"Injected {error_type}", "type": error_type,
+                                              "code": error_type}},
+                           headers={"retry-after": "0"} if status == 429 else None)
+            return
+        completion = backend.completion(body, rule)
+        if body.get("stream"):
+            self.send_stream(completion, delay, (body.get("stream_options") or {}).get("include_usage"))
+        else:
+            time.sleep(delay)
+            self.send_json(200, completion)
+
+    def send_stream(self, completion, delay, include_usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"],
+                "model": completion["model"]}
+        choice = completion["choices"][0]
+        content = choice["message"].get("content") or ""
+        size = max(1, -(-len(content) // stream_chunks))
+        parts = [content[i:i + size] for i in range(0, len(content), size)]
+        try:
+            for part in parts:
+                time.sleep(delay / max(1, len(parts)))
+                self.send_event({**base, "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}]})
+            self.send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": choice["finish_reason"]}]})
+            if include_usage:
+                self.send_event({**base, "choices": [], "usage": completion["usage"]})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stops reading once the JSON object is complete
+            pass
+
+    def send_event(self, data):
+        self.wfile.write(b"data: " + json.dumps(data).encode("utf-8") + b"\n\n")
+        self.wfile.flush()
+
+
+def make_stub_server(host="127.0.0.1", port=8000, **backend_args):
+    """A server answering with a `StubBackend`; call its `serve_forever()` to start it."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.backend = StubBackend(**backend_args)
+    return server
+
+
+def start_stub_server(host="127.0.0.1", port=8000, **backend_args):
+    """Serve a `StubBackend` from a daemon thread and return the server; `server.shutdown()` stops it."""
+    server = make_stub_server(host, port, **backend_args)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat completions endpoint")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--script", type=str, default=None, help="JSON file with the list of scripted answers")
+    parser.add_argument("--recording", type=str, default=None, help="Response cache file to replay")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each answer (default is 0)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random variation of the latency, in seconds")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Share of requests answered with an error")
+    parser.add_argument("--error_status", type=int, default=500, help="HTTP status of injected errors (default is 500)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the latency and error randomness")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+    server = make_stub_server(args.host, args.port, script=script, recording=args.recording, latency=args.latency,
+                              jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+                              seed=args.seed)
+    print(f"Serving chat completions on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    backend = server.backend
+    print(f"{backend.requests} requests, {backend.errors} injected errors.")
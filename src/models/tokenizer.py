@@ -0,0 +1,73 @@
+import json
+import threading
+
+import tiktoken
+
+from src.record import print_and_log
+
+# Context window (prompt and completion) of the supported models, in tokens.
+CONTEXT_WINDOWS = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o-mini-2024-07-18": 128000,
+    "gpt-4o-2024-05-13": 128000,
+    "gpt-4o-2024-08-06": 128000,
+    "gpt-4-turbo-2024-04-09": 128000,
+    "gpt-4-0125-preview": 128000,
+    "gpt-4-1106-preview": 128000,
+    "gpt-3.5-turbo-0125": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+}
+default_context_window = 16385
+# Framing tokens the chat format adds around every message, and once to prime the reply.
+tokens_per_message = 3
+tokens_per_reply = 3
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def context_window(model):
+    return CONTEXT_WINDOWS.get(model, default_context_window)
+
+
+def get_encoding(model):
+    """The tiktoken encoding of the model, or None if its BPE file is neither cached nor downloadable.
+
+    The outcome is remembered per encoding, so a failed load (and its log line) happens once per process.
+    """
+    name = "o200k_base" if model.startswith("gpt-4o") else "cl100k_base"
+    with _encodings_lock:
+        if name not in _encodings:
+            encoding = None
+            try:
+                # tiktoken downloads the BPE file on first use unless it is cached (TIKTOKEN_CACHE_DIR).
+                encoding = tiktoken.get_encoding(name)
+            except Exception as e:
+                print_and_log(f"Could not load the {name} encoding ({type(e).__name__}: {e}), token counts "
+                              f"are estimated from the text length.")
+            _encodings[name] = encoding
+        return _encodings[name]
+
+
+def count_text_tokens(text, model):
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        # about three characters per token for code-heavy text, erring on the high side
+        return (len(text) + 2) // 3
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(message, model):
+    tokens = tokens_per_message + count_text_tokens(message.get("role"), model) \
+             + count_text_tokens(message.get("content"), model)
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call["function"]
+        tokens += tokens_per_message + count_text_tokens(function["name"], model) \
+                  + count_text_tokens(function["arguments"], model)
+    return tokens
+
+
+def count_tools_tokens(tools, model):
+    return count_text_tokens(json.dumps(tools), model) if tools else 0
@@ -0,0 +1,81 @@
+import json
+import os
+
+USAGE_FILE = "usage.json"
+USAGE_FIELDS = ["calls", "input_tokens", "output_tokens", "cached_tokens", "replayed_calls", "latency"]
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens the API served from its prompt cache, when it reports them."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        return 0
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def empty_usage():
+    return {field: 0 for field in USAGE_FIELDS}
+
+
+def add_usage(total, usage):
+    for field in USAGE_FIELDS:
+        total[field] += usage.get(field, 0)
+
+
+class UsageTracker:
+    """Tokens and latency of the model calls of one bug, per phase of `run` (issue analysis, tool loop,
+    review, location proposal, self-check, advanced identification, ranking).
+
+    Calls answered by the response cache cost nothing: they are counted as replayed, without their tokens.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    def record(self, phase, input_tokens, output_tokens, metrics=None):
+        metrics = metrics or {}
+        usage = self.phases.setdefault(phase, empty_usage())
+        usage["calls"] += 1
+        usage["latency"] += metrics.get("latency") or 0
+        if metrics.get("cached"):
+            usage["replayed_calls"] += 1
+            return
+        usage["input_tokens"] += input_tokens
+        usage["output_tokens"] += output_tokens
+        usage["cached_tokens"] += metrics.get("cached_tokens") or 0
+
+    def total(self):
+        total = empty_usage()
+        for usage in self.phases.values():
+            add_usage(total, usage)
+        return total
+
+    def to_dict(self):
+        return {"phases": self.phases, "total": self.total()}
+
+    def save(self, output_dir):
+        with open(os.path.join(output_dir, USAGE_FILE), "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+def roll_up_usage(output_dir):
+    """Add up the usage.json of every bug run under `output_dir`, per phase, and write the sums to
+    `output_dir/usage.json`."""
+    phases = {}
+    total = empty_usage()
+    bug_runs = 0
+    for root, _, files in os.walk(output_dir):
+        if USAGE_FILE not in files or os.path.samefile(root, output_dir):
+            continue
+        with open(os.path.join(root, USAGE_FILE), "r") as f:
+            usage = json.load(f)
+        bug_runs += 1
+        for phase, phase_usage in usage["phases"].items():
+            add_usage(phases.setdefault(phase, empty_usage()), phase_usage)
+        add_usage(total, usage["total"])
+    rollup = {"bug_runs": bug_runs, "phases": phases, "total": total}
+    with open(os.path.join(output_dir, USAGE_FILE), "w") as f:
+        json.dump(rollup, f, indent=4)
+    return rollup
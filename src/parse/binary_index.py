@@ -0,0 +1,227 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+# File layout: magic | version (u32) | header length (u32) | JSON header | zero padding to 8 bytes | columns.
+# The header maps every column name to its offset, length and array typecode; the columns themselves are
+# flat native-endian arrays, so a loaded file is a set of memoryviews over one mmap.
+INDEX_MAGIC = b"FLIX"
+INDEX_VERSION = 3
+ENTITY_TYPES = ["class", "interface", "method", "constructor"]
+_PREAMBLE = struct.Struct("<4sII")
+
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, s):
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[s] = string_id
+            self.strings.append(s)
+        return string_id
+
+
+def write_columns(path, magic, version, columns, strings, header=None):
+    """Write named `array` columns, the interned strings and an optional JSON header as one columnar file."""
+    encoded = [s.encode("utf-8") for s in strings.strings]
+    string_offsets = array("i", [0])
+    for s in encoded:
+        string_offsets.append(string_offsets[-1] + len(s))
+    columns = dict(columns, string_offsets=string_offsets, string_data=array("B", b"".join(encoded)))
+
+    layout = {}
+    blobs = []
+    offset = 0
+    for name, column in columns.items():
+        blob = column.tobytes()
+        layout[name] = {"offset": offset, "length": len(column), "typecode": column.typecode}
+        blobs.append(blob + b"\0" * (-len(blob) % 8))
+        offset += len(blobs[-1])
+    header = dict(header or {}, byteorder=sys.byteorder, strings=len(encoded), columns=layout)
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(_PREAMBLE.size + len(header)) % 8)
+
+    # Readers may map the file at any time (other bugs sharing the index directory): write a temporary file
+    # next to it and move it into place, so that they see either the old file or the complete new one.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_PREAMBLE.pack(magic, version, len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class ColumnarFile:
+    """Read-only view of a file written by `write_columns`, memory-mapped unless `use_mmap` is False."""
+
+    def __init__(self, path, magic, version, use_mmap=True):
+        with open(path, "rb") as f:
+            if use_mmap:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._mm = f.read()
+        magic_found, version_found, header_length = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic_found != magic or version_found != version:
+            raise ValueError(f"{path} is not a version {version} {magic.decode()} file.")
+        self.header = json.loads(bytes(self._mm[_PREAMBLE.size:_PREAMBLE.size + header_length]))
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.header['byteorder']}-endian machine.")
+        base = _PREAMBLE.size + header_length
+        self._view = memoryview(self._mm)
+        self._columns = {}
+        for name, info in self.header["columns"].items():
+            itemsize = array(info["typecode"]).itemsize
+            start = base + info["offset"]
+            self._columns[name] = self._view[start:start + info["length"] * itemsize].cast(info["typecode"])
+        self._string_cache = {}
+
+    def string(self, string_id):
+        s = self._string_cache.get(string_id)
+        if s is None:
+            offsets = self._columns["string_offsets"]
+            s = bytes(self._columns["string_data"][offsets[string_id]:offsets[string_id + 1]]).decode("utf-8")
+            self._string_cache[string_id] = s
+        return s
+
+    def close(self):
+        for column in self._columns.values():
+            column.release()
+        self._columns = {}
+        self._view.release()
+        if isinstance(self._mm, mmap.mmap):
+            self._mm.close()
+
+
+def entity_rows(entities):
+    """Flatten an entity tree in pre-order.
+
+    Every row is (type, name, start_line, end_line, parent, start_byte, end_byte, signature, javadoc), where
+    `parent` is the row of the enclosing entity, or -1 for a top-level one.
+    """
+    rows = []
+
+    def flatten(entities, parent):
+        for entity in entities:
+            index = len(rows)
+            rows.append((entity["type"], entity["name"], entity["start_line"], entity["end_line"], parent,
+                         entity["start_byte"], entity["end_byte"], entity["signature"], entity["comment"]))
+            flatten(entity.get("children", []), index)
+
+    flatten(entities, -1)
+    return rows
+
+
+def write_index(index_path, files):
+    """Write the entity trees of a codebase as one binary index.
+
+    `files` is an ordered list of (relative path, content key, encoding, entity tree) tuples; the entity tree
+    has the layout produced by `parse_java_file`. Entities are flattened in pre-order and keep the index of
+    their parent.
+    """
+    strings = StringTable()
+    columns = {
+        "file_path": array("i"),
+        "file_content_key": array("i"),
+        "file_encoding": array("i"),
+        "file_entity_start": array("i"),
+        "file_entity_count": array("i"),
+        "entity_type": array("B"),
+        "entity_name": array("i"),
+        "entity_start_line": array("i"),
+        "entity_end_line": array("i"),
+        "entity_parent": array("i"),
+        "entity_start_byte": array("i"),
+        "entity_end_byte": array("i"),
+        "entity_signature": array("i"),
+        "entity_comment": array("i"),
+    }
+
+    for relative_path, key, encoding, entities in files:
+        start = len(columns["entity_type"])
+        columns["file_path"].append(strings.intern(relative_path))
+        columns["file_content_key"].append(strings.intern(key))
+        columns["file_encoding"].append(strings.intern(encoding))
+        columns["file_entity_start"].append(start)
+        for entity_type, name, start_line, end_line, parent, start_byte, end_byte, signature, comment in \
+                entity_rows(entities):
+            columns["entity_type"].append(ENTITY_TYPES.index(entity_type))
+            columns["entity_name"].append(strings.intern(name))
+            columns["entity_start_line"].append(start_line)
+            columns["entity_end_line"].append(end_line)
+            columns["entity_parent"].append(parent + start if parent != -1 else -1)
+            columns["entity_start_byte"].append(start_byte)
+            columns["entity_end_byte"].append(end_byte)
+            columns["entity_signature"].append(strings.intern(signature))
+            columns["entity_comment"].append(strings.intern(comment))
+        columns["file_entity_count"].append(len(columns["entity_type"]) - start)
+
+    write_columns(index_path, INDEX_MAGIC, INDEX_VERSION, columns, strings)
+
+
+class BinaryIndex(ColumnarFile):
+    """Read-only, memory-mapped view of an index written by `write_index`."""
+
+    def __init__(self, index_path):
+        super().__init__(index_path, INDEX_MAGIC, INDEX_VERSION)
+        self.file_paths = [self.string(i) for i in self._columns["file_path"]]
+        self._file_ids = {path: i for i, path in enumerate(self.file_paths)}
+
+    def has_file(self, relative_path):
+        return relative_path in self._file_ids
+
+    def entity_range(self, relative_path):
+        file_id = self._file_ids[relative_path]
+        start = self._columns["file_entity_start"][file_id]
+        return range(start, start + self._columns["file_entity_count"][file_id])
+
+    def entity(self, index):
+        """Return (type, name, start_line, end_line, parent index) of a flattened entity."""
+        c = self._columns
+        return (ENTITY_TYPES[c["entity_type"][index]], self.string(c["entity_name"][index]),
+                c["entity_start_line"][index], c["entity_end_line"][index], c["entity_parent"][index])
+
+    def entity_source(self, index):
+        """Return (start_byte, end_byte, signature, javadoc) of a flattened entity."""
+        c = self._columns
+        return (c["entity_start_byte"][index], c["entity_end_byte"][index], self.string(c["entity_signature"][index]),
+                self.string(c["entity_comment"][index]))
+
+    def file_entity_rows(self, relative_path):
+        """The entities of one file as `entity_rows` returns them, with parents relative to the file."""
+        entities = self.entity_range(relative_path)
+        rows = []
+        for index in entities:
+            entity_type, name, start_line, end_line, parent = self.entity(index)
+            rows.append((entity_type, name, start_line, end_line, parent - entities.start if parent != -1 else -1)
+                        + self.entity_source(index))
+        return rows
+
+    def file_encoding(self, relative_path):
+        return self.string(self._columns["file_encoding"][self._file_ids[relative_path]])
+
+    def content_encodings(self):
+        """Yield (content key, encoding) of every indexed file."""
+        for key_id, encoding_id in zip(self._columns["file_content_key"], self._columns["file_encoding"]):
+            yield self.string(key_id), self.string(encoding_id)
+
+    def class_names(self, relative_path):
+        """Classes and interfaces declared in a file, in pre-order (the former summary.json entry)."""
+        names = []
+        for index in self.entity_range(relative_path):
+            entity_type, name, *_ = self.entity(index)
+            if entity_type in ("class", "interface"):
+                names.append(name)
+        return names
@@ -0,0 +1,41 @@
+import hashlib
+import json
+import os
+import tempfile
+
+# Bump when the cached record layout or the parsing rules change, so stale entries are ignored.
+PARSE_CACHE_VERSION = "v3"
+
+
+def content_key(code):
+    """Key a source file by its bytes, so identical files in different checkouts share one entry."""
+    return hashlib.sha1(code).hexdigest()
+
+
+def cache_entry_path(cache_dir, key):
+    return os.path.join(cache_dir, PARSE_CACHE_VERSION, key[:2], key + ".json")
+
+
+def load_cached_parse(cache_dir, key):
+    try:
+        with open(cache_entry_path(cache_dir, key), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_cached_parse(cache_dir, key, record):
+    """Write an entry atomically; concurrent indexers of the same content race harmlessly."""
+    entry_path = cache_entry_path(cache_dir, key)
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, entry_path)
+    except OSError:
+        # an entry that cannot be written is parsed again next time
+        pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,34 +1,77 @@
 from tree_sitter import Language, Parser
 from config.constants import TREE_SITTER_JAVA_LIB
-import json
 import os
-from src.tools.auxiliary import detect_file_encoding
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.parse.binary_index import write_index
+from src.parse.parse_cache import content_key, load_cached_parse, store_cached_parse
+from src.record import print_and_log
+from src.tools.auxiliary import detect_encoding, clean_comment, extract_signature_changed
 
 JAVA_LANGUAGE = Language(TREE_SITTER_JAVA_LIB, 'java')
+progress_interval = 1000
 
+# One parser per indexing worker process, created by `_init_worker`.
+_worker_parser = None
 
-def parse_java_file(file_path,encoding='utf-8'):
-    # Read and parse Java files
-    with open(file_path, 'rb') as file:
-        code = file.read()
+
+def new_parser():
     parser = Parser()
     parser.set_language(JAVA_LANGUAGE)
+    return parser
+
+
+def _init_worker():
+    global _worker_parser
+    _worker_parser = new_parser()
+
+
+def parse_java_file(file_path, encoding='utf-8', parser=None):
+    """Parse a Java file once and return its entity tree.
+
+    Besides its line range, every entity records its byte range and the cleaned javadoc above it; methods
+    and constructors also record their normalized signature.
+    """
+    with open(file_path, 'rb') as file:
+        code = file.read()
+    return parse_java_source(code, encoding, parser)
+
+
+def parse_java_source(code, encoding='utf-8', parser=None):
+    if parser is None:
+        parser = new_parser()
     tree = parser.parse(code)
+    # Comment nodes met since the last other node in pre-order: the comments directly above a declaration.
+    comment_run = []
+
     def walk_tree(node):
         results = []
-        if node.type in ['class_declaration', 'interface_declaration', 'method_declaration','constructor_declaration']:
+        if node.type in ['comment', 'line_comment', 'block_comment']:
+            comment_run.append(node)
+            return results
+        preceding_comments = comment_run[:]
+        comment_run.clear()
+        if node.type in ['class_declaration', 'interface_declaration', 'method_declaration', 'constructor_declaration']:
             entity = {
                 'type': node.type.replace('_declaration', ''),  # Simplify type names
                 'name': '',
                 'start_line': node.start_point[0] + 1,
                 'end_line': node.end_point[0] + 1,
+                'start_byte': node.start_byte,
+                'end_byte': node.end_byte,
+                'signature': '',
+                'comment': '',
                 'children': []
             }
 
-            if node.type in ['class_declaration', 'interface_declaration','method_declaration','constructor_declaration']:
-                identifier = next((child for child in node.children if child.type == 'identifier'), None)
-                if identifier:
-                    entity['name'] = identifier.text.decode(encoding)
+            identifier = next((child for child in node.children if child.type == 'identifier'), None)
+            if identifier:
+                entity['name'] = identifier.text.decode(encoding)
+            if node.type not in ['class_declaration', 'interface_declaration']:
+                entity['signature'] = extract_signature_changed(node, encoding=encoding)
+            comments = [code[c.start_byte:c.end_byte].decode(encoding, errors='replace').strip()
+                        for c in preceding_comments if c.start_point[0] + 1 < entity['start_line']]
+            entity['comment'] = clean_comment("\n".join(comments))
 
             for child in node.children:
                 entity['children'].extend(walk_tree(child))
@@ -41,22 +84,81 @@ def parse_java_file(file_path,encoding='utf-8'):
         return results
 
     root_node = tree.root_node
-    json_data = walk_tree(root_node)
-    return json_data
+    return walk_tree(root_node)
+
+
+def index_java_file(code_base, relative_path, parser=None, cache_dir=None):
+    """Parse one file of the codebase.
+
+    Returns its content key, encoding and entity tree, and whether the parse was served from the
+    content-addressed cache.
+    """
+    full_path = os.path.join(code_base, relative_path)
+    with open(full_path, 'rb') as file:
+        code = file.read()
+    key = content_key(code)
+    cached = load_cached_parse(cache_dir, key) if cache_dir else None
+    if cached and "encoding" in cached:
+        return key, cached["encoding"], cached["entities"], True
+    encoding = detect_encoding(code)
+    json_data = parse_java_source(code, encoding=encoding, parser=parser or _worker_parser)
+    if cache_dir:
+        store_cached_parse(cache_dir, key, {"entities": json_data, "encoding": encoding})
+    return key, encoding, json_data, False
+
 
+def _index_java_file_in_worker(task):
+    return index_java_file(*task)
 
-def process_java_files(code_base, output_base):
+
+def list_java_files(code_base):
+    java_files = []
     for root, dirs, files in os.walk(code_base):
         for file in files:
             if file.endswith(".java"):
-                full_path = os.path.join(root, file)
-                print("Processing file: ", full_path)
-                relative_path = os.path.relpath(full_path, code_base)
-                output_dir = os.path.join(output_base, os.path.dirname(relative_path))
-                os.makedirs(output_dir, exist_ok=True)
-                json_data = parse_java_file(full_path,encoding=detect_file_encoding(full_path))
-                json_output_path = os.path.join(output_dir, file[:-5] + ".json")
-                with open(json_output_path, 'w') as json_file:
-                    json.dump(json_data, json_file, indent=4)
-                print(f"Processed {full_path} to {json_output_path}")
+                java_files.append(os.path.relpath(os.path.join(root, file), code_base))
+    return java_files
+
+
+def process_java_files(code_base, index_path, workers=1, quiet=False, cache_dir=None):
+    """Index every Java file of the codebase in a single pass.
+
+    Writes the entity trees of all source files to one binary index at `index_path` (see
+    `src.parse.binary_index`). With `workers` > 1 the files are parsed by a process pool (one parser
+    per worker); files keep the `os.walk` order either way. `quiet` replaces the per-file output with
+    periodic progress lines. If `cache_dir` is set, parses are looked up by file content there first,
+    so files already seen in another checkout are not parsed again.
+    """
+    time_start = time.time()
+    java_files = list_java_files(code_base)
+    indexed_files = []
+    cache_hits = 0
+
+    def report(done, relative_path):
+        if not quiet:
+            print(f"Processed {os.path.join(code_base, relative_path)}")
+        elif done % progress_interval == 0:
+            print_and_log(f"Indexed {done}/{len(java_files)} Java files.")
+
+    if workers > 1:
+        tasks = [(code_base, relative_path, None, cache_dir) for relative_path in java_files]
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            # map() yields in submission order, so the merge does not depend on scheduling.
+            for done, (relative_path, (key, encoding, entities, hit)) in enumerate(
+                    zip(java_files, executor.map(_index_java_file_in_worker, tasks, chunksize=chunksize)), start=1):
+                indexed_files.append((relative_path, key, encoding, entities))
+                cache_hits += hit
+                report(done, relative_path)
+    else:
+        parser = new_parser()
+        for done, relative_path in enumerate(java_files, start=1):
+            key, encoding, entities, hit = index_java_file(code_base, relative_path, parser, cache_dir)
+            indexed_files.append((relative_path, key, encoding, entities))
+            cache_hits += hit
+            report(done, relative_path)
 
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    write_index(index_path, indexed_files)
+    print_and_log(f"Indexed {len(java_files)} Java files ({cache_hits} from the parse cache) with {workers} worker(s) "
+                  f"in {time.time() - time_start:.1f} seconds. Index saved to {index_path}")
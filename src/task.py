@@ -1,8 +1,9 @@
+import asyncio
 import os
 import time
 from pathlib import Path
 from src.custom_signal import TaskMainNormalExit, TaskMainErrorExit
-from src.tools.auxiliary import find_class_from_file, is_abstract_method
+from src.tools.auxiliary import find_class_from_file, is_abstract_method, parsed_files
 from src.codebase import CodeBase
 from loguru import logger
 from src.record import print_and_log
@@ -13,16 +14,16 @@ from src.prompt import fl_agent_system_with_tools, fl_agent_user_with_tools_firs
     fl_agent_user_with_tools_upgrade_no_review_result, fl_agent_final_bug_location_no_review_result, \
     fl_agent_user_with_tools_second_no_review_result, \
     location_double_ask_force
-from src.models.GPT import Model
+from src.models.GPT import Model, AsyncModel
+from src.models.response_cache import response_cache
+from src.models.usage import UsageTracker
 from src.message import MessageRecord
 import json
 from src.tools.tools_invoker import ToolsInvoker, get_tools_list
 from src.parse.parse_repo import process_java_files
-from src.parse.parse_summary import generate_summary
+from config.constants import parse_cache_base
 from src.dataset.repo_d4j import recognize_pattern
 from src.tools.utils import inspect_tools, extract_method_name, split_methods
-input_tokens_sum = 0
-output_tokens_sum = 0
 
 
 def extract_json_from_response(res_content):
@@ -85,12 +86,6 @@ def get_bl_output(bug_file, bug_class, bug_method, bug_codebase, tools_collect:
     return bug_file, bug_class, bug_method, output, filtered_candidate_list
 
 
-def update_tokens(add_input, add_output):
-    global input_tokens_sum, output_tokens_sum
-    input_tokens_sum += add_input
-    output_tokens_sum += add_output
-
-
 def detect_constructor(bug_method, bug_class):
     if "<init>" in bug_method:
         return bug_method.replace("<init>", bug_class.strip(), 1)
@@ -180,20 +175,15 @@ def construct_buggy_loc(bug_locations):
         bug_locations_res += f"\nBug Location {i + 1}:" + f'<file>{item["file"]}</file> <class>{item["class"]}</class> \n<comment>\n{item["comment"]}\n</comment>\n<signature>{item["signature"]}</signature>\n<code>\n{item["code"]}\n</code>\n'
     return bug_locations_res
 
-def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_output_dir, trigger_test_info, codebase_path, trigger_test, advanced_identification=False, re_check=False, partial_save=False, issue_analysis=True, review_result=True, location_extraction_flag=True):
-    bug_input_tokens_sum = 0
-    bug_output_tokens_sum = 0
-
-    def bug_update_tokens(add_input, add_output):
-        nonlocal bug_input_tokens_sum, bug_output_tokens_sum
-        bug_input_tokens_sum += add_input
-        bug_output_tokens_sum += add_output
-
+def _run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_output_dir, trigger_test_info, codebase_path, trigger_test, advanced_identification=False, re_check=False, partial_save=False, issue_analysis=True, review_result=True, location_extraction_flag=True, index_workers=1, quiet_index=False, lazy_index=False, trigger_tests=None, model_class=Model, context_budget=0, usage=None):
+    if usage is None:
+        usage = UsageTracker()
     time_start = time.time()
 
     functions_call_record = []
     log_handler_id = logger.add(os.path.join(bug_output_dir, "record.log"),
                                 level="INFO",
+                                filter=lambda record: record["extra"].get("bug_id") == bug_id,
                                 format=(
                                     "<cyan>{time:YYYY/MM/DD - HH:mm:ss.SSS}</cyan> | <magenta>{level: ^10}</magenta>"
                                     " | <level>{message}</level>"
@@ -216,7 +206,7 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
         proj_main_pattern += "..."
         proj_test_pattern += "..."
 
-    message_record = MessageRecord()
+    message_record = MessageRecord(tool_output_budget=context_budget, model=model_type)
     func_call_record_all = []
     bug_locations = []
     top_1_buggy = {}
@@ -224,7 +214,7 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
     recheck_conduct = False  # if self-check is needed
     try:
 
-        agent_base = Model()
+        agent_base = model_class()
         agent_base.initial_model_config(model_type)
         test_src = trigger_test_info["src"]
         test_path = trigger_test_info["path"]
@@ -251,26 +241,29 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
             message_record.add_msg("user", fl_user_prompt)
             print_and_log("initial issue analysis:\n" + message_record.get_last_msg()["content"])
             res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                message_record.get_msgs(),temp=temperature)
-            update_tokens(input_tokens, output_tokens)
-            bug_update_tokens(input_tokens, output_tokens)
+                message_record.get_call_msgs(),temp=temperature)
+            usage.record("issue_analysis", input_tokens, output_tokens, agent_base.last_call_metrics)
             print_and_log("res_content:\n" + res_content)
             message_record.add_assistant_msg(res_content, [])
         if issue_analysis is True:
             message_record.add_msg("user", fl_agent_user_with_tools_first)
         else:
             message_record.add_msg("user",fl_user_prompt + fl_agent_user_with_tools_first_without_issue_analysis)
-        parsed_files_path = os.path.join(parsed_dir, bug_id, "result")
-        parsed_summary = os.path.join(parsed_dir, bug_id, "summary", "summary.json")
-        if not os.path.exists(parsed_files_path):
-            process_java_files(codebase_path, parsed_files_path)
-        if not os.path.exists(parsed_summary):
-            generate_summary(codebase_path, os.path.join(parsed_dir, bug_id, "summary"))
-
-        bug_codebase = CodeBase(codebase_path,
-                                parsed_files_path)
-        bug_codebase.load_parsed_files(parsed_summary)
-        bug_codebase.read_covered_info(bug_id.split("-")[0],bug_id.split("-")[1],trigger_test)
+        parsed_index_path = os.path.join(parsed_dir, bug_id, "index.bin")
+        bug_codebase = CodeBase(codebase_path, parsed_index_path)
+        if lazy_index and not os.path.exists(parsed_index_path):
+            # parse the covered files now and the others when a tool first needs them
+            bug_codebase.read_covered_info(bug_id.split("-")[0], bug_id.split("-")[1], trigger_test)
+            bug_codebase.load_parsed_files(lazy=True, cache_dir=parse_cache_base)
+        else:
+            if not os.path.exists(parsed_index_path):
+                process_java_files(codebase_path, parsed_index_path, workers=index_workers, quiet=quiet_index,
+                                   cache_dir=parse_cache_base)
+            bug_codebase.load_parsed_files()
+            bug_codebase.read_covered_info(bug_id.split("-")[0],bug_id.split("-")[1],trigger_test)
+        bug_codebase.load_covered_entities(os.path.join(parsed_dir, bug_id, "covered_entities", trigger_test + ".json"))
+        bug_codebase.read_trigger_tests_coverage(bug_id.split("-")[0], bug_id.split("-")[1],
+                                                 trigger_tests or [trigger_test])
         tools_collect = ToolsInvoker(bug_codebase)
         fl_tools = get_tools_list()
         # Prepare tool descriptions in the required format
@@ -278,9 +271,8 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
         print_and_log("start the tool invocation loop.")
         print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
         res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-            message_record.get_msgs(), tools=tools, temp=temperature)
-        update_tokens(input_tokens, output_tokens)
-        bug_update_tokens(input_tokens, output_tokens)
+            message_record.get_call_msgs(tools), tools=tools, temp=temperature)
+        usage.record("tool_loop", input_tokens, output_tokens, agent_base.last_call_metrics)
         # print_and_log(res)
         print_and_log("res_content:" + res_content)
         message_record.add_assistant_msg(res_content, raw_tool_calls)
@@ -312,15 +304,13 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                         message_record.add_msg("user", analyse_result + note)
                     print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                     res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                        message_record.get_msgs(), temp=temperature)
-                    update_tokens(input_tokens, output_tokens)
-                    bug_update_tokens(input_tokens, output_tokens)
+                        message_record.get_call_msgs(), temp=temperature)
+                    usage.record("review", input_tokens, output_tokens, agent_base.last_call_metrics)
                     print(res)
                     print_and_log("analysis:\n" + res_content)
                     message_record.add_assistant_msg(res_content, [])
 
                 current_round = 0
-                global FL_break
                 FL_break = False
                 block_fl_ask = False
                 special_fl_block = False
@@ -353,11 +343,10 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                         while (retry < 3):
                             print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                             res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                message_record.get_msgs(), response_format="json_object", temp=temperature)
+                                message_record.get_call_msgs(), response_format="json_object", temp=temperature)
                             print_and_log("res_content:")
                             print_and_log(res_content)
-                            update_tokens(input_tokens, output_tokens)
-                            bug_update_tokens(input_tokens, output_tokens)
+                            usage.record("location_proposal", input_tokens, output_tokens, agent_base.last_call_metrics)
                             flag, res_dict = extract_json_from_response(res_content)
                             if flag == 0:
                                 retry += 1
@@ -540,13 +529,12 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
 
                                     print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                                     res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                        message_record.get_msgs(), response_format="json_object", temp=temperature)
+                                        message_record.get_call_msgs(), response_format="json_object", temp=temperature)
 
                                     message_record.remove_last_msg()
                                     print_and_log("res_content:")
                                     print_and_log(res_content)
-                                    update_tokens(input_tokens, output_tokens)
-                                    bug_update_tokens(input_tokens, output_tokens)
+                                    usage.record("location_proposal", input_tokens, output_tokens, agent_base.last_call_metrics)
                                     flag, res_dict = extract_json_from_response(res_content)
                                     if flag == 0 or ("reselected_bug_locations" not in res_dict):
                                         reask_try += 1
@@ -667,10 +655,9 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                                         recheck_list = None
                                         while retry < 3:
                                             res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                                message_record.get_msgs(), response_format="json_object",
+                                                message_record.get_call_msgs(), response_format="json_object",
                                                 max_tokens=1024, temp=temperature)
-                                            update_tokens(input_tokens, output_tokens)
-                                            bug_update_tokens(input_tokens, output_tokens)
+                                            usage.record("self_check", input_tokens, output_tokens, agent_base.last_call_metrics)
                                             print_and_log("conditional self-reflection:")
                                             print_and_log(res_content)
                                             flag, res_dict = extract_json_from_response(res_content)
@@ -734,9 +721,8 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                         message_record.add_msg("user", fl_agent_user_with_tools_second_no_review_result)
                     print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                     res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                        message_record.get_msgs(), tools=tools, temp=temperature)
-                    update_tokens(input_tokens, output_tokens)
-                    bug_update_tokens(input_tokens, output_tokens)
+                        message_record.get_call_msgs(tools), tools=tools, temp=temperature)
+                    usage.record("tool_loop", input_tokens, output_tokens, agent_base.last_call_metrics)
                     print_and_log("res_content:\n" + res_content)
                     if raw_tool_calls is None:
                         raw_tool_calls = []
@@ -785,11 +771,10 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
 
                                 print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                                 res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                    message_record.get_msgs(), temp=temperature)
+                                    message_record.get_call_msgs(), temp=temperature)
                                 print(res)
                                 print_and_log("analyse result:\n" + res_content)
-                                update_tokens(input_tokens, output_tokens)
-                                bug_update_tokens(input_tokens, output_tokens)
+                                usage.record("review", input_tokens, output_tokens, agent_base.last_call_metrics)
                                 message_record.add_assistant_msg(res_content, [])
 
 
@@ -800,10 +785,9 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                         retry = 0
                         while retry < 3:
                             res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                message_record.get_msgs(), response_format="json_object", max_tokens=1024, temp=temperature)
+                                message_record.get_call_msgs(), response_format="json_object", max_tokens=1024, temp=temperature)
 
-                            update_tokens(input_tokens, output_tokens)
-                            bug_update_tokens(input_tokens, output_tokens)
+                            usage.record("advanced_identification", input_tokens, output_tokens, agent_base.last_call_metrics)
                             print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                             print_and_log("response for more locations:")
                             print_and_log(res_content)
@@ -939,9 +923,8 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
                         rtry = 0
                         while rtry < 3:
                             res, res_content, raw_tool_calls, function_calls, input_tokens, output_tokens = agent_base.call(
-                                message_record.get_msgs(), response_format="json_object", max_tokens=1024, temp=temperature)
-                            update_tokens(input_tokens, output_tokens)
-                            bug_update_tokens(input_tokens, output_tokens)
+                                message_record.get_call_msgs(), response_format="json_object", max_tokens=1024, temp=temperature)
+                            usage.record("ranking", input_tokens, output_tokens, agent_base.last_call_metrics)
                             print_and_log("prompt:\n" + message_record.get_last_msg()["content"])
                             print_and_log("rank:")
                             print_and_log(res_content)
@@ -979,8 +962,19 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
         time_end = time.time()
         time_cost = time_end - time_start
         print_and_log(f"Time cost: {time_cost} seconds.")
+        cache_stats = parsed_files.stats()
+        print_and_log(f"Parsed file cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
+        if message_record.tool_output_budget:
+            print_and_log(f"Context compaction saved about {message_record.tokens_saved} input tokens.")
+        if response_cache.enabled:
+            cache_stats = response_cache.stats()
+            print_and_log(f"Response cache ({cache_stats['mode']}): {cache_stats['hits']} hits, {cache_stats['misses']} misses.")
         with open(os.path.join(bug_output_dir, "time_cost"), "w") as f:
             f.write(f"{time_cost}")
+        usage.save(bug_output_dir)
+        usage_total = usage.total()
+        print_and_log(f"Tokens: {usage_total['input_tokens']} input ({usage_total['cached_tokens']} cached), "
+                      f"{usage_total['output_tokens']} output in {usage_total['calls']} calls.")
 
         top_1 = Path(bug_output_dir, "top-1.json")
         top_1.write_text(json.dumps(top_1_buggy, indent=4))
@@ -992,4 +986,15 @@ def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, bug_ou
         logger.remove(log_handler_id)
 
 
+def run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, *args, **kwargs):
+    """Localize the bug `bug_id`; the arguments are those of `_run`."""
+    # Bugs may run concurrently: tag this bug's records so that its log file only receives them.
+    with logger.contextualize(bug_id=bug_id):
+        return _run(parsed_dir, FL_round_upperbound, temperature, model_type, bug_id, *args, **kwargs)
+
 
+async def run_async(*args, **kwargs):
+    """`run` for async callers: takes the same arguments and runs the bug in a worker thread, sending its
+    requests through the shared `AsyncModel` event loop, so many bugs can be awaited together."""
+    kwargs.setdefault("model_class", AsyncModel)
+    return await asyncio.to_thread(run, *args, **kwargs)
@@ -1,28 +1,137 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
 import chardet
 from tree_sitter import Language, Parser
 from config.constants import TREE_SITTER_JAVA_LIB
+from src.parse.parse_cache import content_key
 
 JAVA_LANGUAGE = Language(TREE_SITTER_JAVA_LIB, 'java')
-parser = Parser()
-parser.set_language(JAVA_LANGUAGE)
+_thread_state = threading.local()
+# Source bytes kept by the parsed file cache; the trees cost several times more.
+parsed_file_cache_bytes = 32 * 1024 * 1024
+
+
+def get_parser():
+    """The parser of the calling thread; a tree-sitter parser must not be used by two threads at once."""
+    parser = getattr(_thread_state, "parser", None)
+    if parser is None:
+        parser = Parser()
+        parser.set_language(JAVA_LANGUAGE)
+        _thread_state.parser = parser
+    return parser
+
+
+class ParsedFileCache:
+    """LRU of (source bytes, tree-sitter Tree) per Java file, bounded by the total size of the sources.
+
+    Entries are keyed by path and revalidated against the file's mtime and size, so an edited file is
+    parsed again on its next access.
+    """
+
+    def __init__(self, max_bytes=parsed_file_cache_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path):
+        """Return the bytes and the parse tree of a file, parsing it only if it is not cached."""
+        key = os.path.abspath(file_path)
+        stat = os.stat(key)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+        # Read and parse outside the lock, so that threads missing different files do not wait for each other.
+        with open(key, 'rb') as file:
+            code = file.read()
+        tree = get_parser().parse(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._size -= len(entry[1])
+            self._entries[key] = (stamp, code, tree)
+            self._entries.move_to_end(key)
+            self._size += len(code)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            return code, tree
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "files": len(self._entries), "bytes": self._size}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+parsed_files = ParsedFileCache()
+
+
+def clean_comment(comment):
+    javadoc_pattern = re.compile(r'/\*\*.*?\*/', re.DOTALL)
+    javadocs = javadoc_pattern.findall(comment)
+    javadocs_combined = "\n".join(javadocs)
+    return javadocs_combined
+
+
+# Encodings already resolved, by content hash and by (path, mtime, size). The first is seeded from the index.
+_content_encodings = {}
+_file_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def detect_encoding(code):
+    """Resolve the encoding of Java source bytes: strict UTF-8 (which covers ASCII) first, chardet otherwise."""
+    try:
+        code.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    encoding = chardet.detect(code)['encoding']
+    if encoding is None:
+        encoding = 'utf-8'
+    return encoding
+
+
+def remember_encoding(key, encoding):
+    """Record the encoding of the content with the given `content_key`, e.g. as stored in the index."""
+    with _encodings_lock:
+        _content_encodings[key] = encoding
 
 
 def detect_file_encoding(file_path):
-    with open(file_path, 'rb') as file:
-        raw_data = file.read()
-        result = chardet.detect(raw_data)
-        encoding = result['encoding']
-        # print(encoding)
+    stat = os.stat(file_path)
+    stamp = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    with _encodings_lock:
+        encoding = _file_encodings.get(stamp)
     if encoding is None:
-        encoding = 'utf-8'
+        with open(file_path, 'rb') as file:
+            raw_data = file.read()
+        key = content_key(raw_data)
+        with _encodings_lock:
+            encoding = _content_encodings.get(key)
+        if encoding is None:
+            encoding = detect_encoding(raw_data)
+        with _encodings_lock:
+            _content_encodings.setdefault(key, encoding)
+            _file_encodings[stamp] = encoding
     return encoding
 
 
 def find_target_and_comments_change(file_path, name, start_line, flag=0):
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
-    tree = parser.parse(code)
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     comments = []
@@ -73,10 +182,7 @@ def find_target_and_comments_change(file_path, name, start_line, flag=0):
 
 
 def find_method_node(file_path, method_name, start_line):
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
-    tree = parser.parse(code)
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     encoding = detect_file_encoding(file_path)
@@ -99,10 +205,7 @@ def find_method_node(file_path, method_name, start_line):
 
 
 def find_target_and_comments(file_path, name, start_line, flag=0):
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
-    tree = parser.parse(code)
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     comments = []
@@ -203,7 +306,7 @@ def extract_methods_from_class(class_content, file_path, shift, encoding='utf-8'
     comments = []
     methods = []
 
-    tree = parser.parse(class_content)
+    tree = get_parser().parse(class_content)
     root_node = tree.root_node
     class_declaration = next(
         (node for node in root_node.children if node.type in ['class_declaration', 'interface_declaration']), None)
@@ -254,7 +357,7 @@ def extract_info_from_innerclass(class_content, shift, encoding='utf-8'):
     methods_info = []
     fields_list = []
 
-    tree = parser.parse(class_content)
+    tree = get_parser().parse(class_content)
     root_node = tree.root_node
     class_declaration = next(
         (node for node in root_node.children if node.type in ['class_declaration', 'interface_declaration']), None)
@@ -301,11 +404,8 @@ def find_class_from_file(file_path, class_name):
                 return result
         return None
 
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
+    code, tree = parsed_files.get(file_path)
     encoding = detect_file_encoding(file_path)
-    tree = parser.parse(code)
     root_node = tree.root_node
     class_node = find_class_declaration(root_node, class_name, code, encoding)
 
@@ -326,7 +426,7 @@ def extract_children_from_class(file_path, class_content, shift, encoding='utf-8
     methods = []
     inner_classes = []
     inner_interfaces = []
-    tree = parser.parse(class_content)
+    tree = get_parser().parse(class_content)
     root_node = tree.root_node
     class_declaration = next((node for node in root_node.children if node.type == f'{actual_type}_declaration'), None)
     class_name = ""
@@ -375,7 +475,7 @@ def extract_children_from_class(file_path, class_content, shift, encoding='utf-8
 
 
 def extract_inheritance_info(class_content):
-    tree = parser.parse(class_content)
+    tree = get_parser().parse(class_content)
     root_node = tree.root_node
 
     base_class_name = None
@@ -406,16 +506,13 @@ def extract_inheritance_info(class_content):
 
 def extract_imports(file_path):
     encoding = detect_file_encoding(file_path)
-    with open(file_path, 'r', encoding=encoding) as file:
-        source_code = file.read()
-
-    tree = parser.parse(bytes(source_code, encoding))
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     imports = []
     for node in root_node.children:
         if node.type == 'import_declaration':
-            import_statement = source_code[node.start_byte:node.end_byte]
+            import_statement = code[node.start_byte:node.end_byte].decode(encoding, errors='replace')
             imports.append(import_statement)
 
     return imports
@@ -428,7 +525,7 @@ def byte_to_character_position(code_line, byte_position):
 
 def is_abstract_method(method_code: str) -> bool:
     """Check if a given method code is abstract."""
-    tree = parser.parse(bytes(method_code, 'utf8'))
+    tree = get_parser().parse(bytes(method_code, 'utf8'))
     root_node = tree.root_node
     for node in root_node.children:
         if node.type == 'method_declaration':
@@ -441,7 +538,7 @@ def is_abstract_method(method_code: str) -> bool:
 
 
 def extract_innerclass_from_class(outer_type, class_content, inner_class, encoding='utf-8'):
-    tree = parser.parse(class_content)
+    tree = get_parser().parse(class_content)
     root_node = tree.root_node
     if outer_type == "class":
         class_declaration = next((node for node in root_node.children if node.type == 'class_declaration'), None)
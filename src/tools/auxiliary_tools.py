@@ -1,20 +1,10 @@
 import os
-from tree_sitter import Language, Parser
-from config.constants import TREE_SITTER_JAVA_LIB
-from src.tools.auxiliary import extract_methods_from_class,detect_file_encoding
-
-JAVA_LANGUAGE = Language(TREE_SITTER_JAVA_LIB, 'java')
-
-parser = Parser()
-parser.set_language(JAVA_LANGUAGE)
+from src.tools.auxiliary import extract_methods_from_class,detect_file_encoding,parsed_files
 
 
 def _get_package_name(file_path):
     """Get the package name of the specified file."""
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
-    tree = parser.parse(code)
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     for child in root_node.children:
@@ -27,10 +17,7 @@ def _get_package_name(file_path):
 
 def _get_imports(file_path):
     """Retrieve a list of libraries imported in the specified file."""
-    with open(file_path, 'rb') as file:
-        code = file.read()
-
-    tree = parser.parse(code)
+    code, tree = parsed_files.get(file_path)
     root_node = tree.root_node
 
     imports = []
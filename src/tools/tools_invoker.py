@@ -11,7 +11,8 @@ def get_tools_list():
         "get_class_info",
         "get_covered_files_from_dir",
         "get_inner_class_info",
-        "get_imports"
+        "get_imports",
+        "get_suspicious_methods"
     ]
     return fl_agent_tools
 
@@ -211,6 +212,15 @@ class ToolsInvoker:
         """
         return self.codebase.get_imports(file_path)
 
+    def get_suspicious_methods(self, top_n=10) -> str:
+        """Rank the covered methods by their suspiciousness score computed from the coverage of the failing tests.
 
+        Returns the most suspicious covered methods (file, class, method signature), each with its score and the number of failing tests that cover it. Use it to pick the methods worth extracting first.
 
+        Args:
+            top_n (integer, optional): Number of methods to return, at most 10. Defaults to 10.
 
+        Returns:
+            The ranked list of methods or an error message.
+        """
+        return self.codebase.get_suspicious_methods(top_n=top_n)
@@ -97,3 +97,29 @@ def split_methods(input_string):
 
 
 
+
+
+class PathSuffixTrie:
+    """Trie over reversed path components, answering "which paths end with these components".
+
+    Every node keeps the paths below it in insertion order, so a lookup costs one step per query component.
+    """
+
+    def __init__(self, paths=()):
+        self.root = {"children": {}, "paths": []}
+        for path in paths:
+            self.add(path)
+
+    def add(self, path):
+        node = self.root
+        for part in reversed(os.path.normpath(path).split(os.sep)):
+            node = node["children"].setdefault(part, {"children": {}, "paths": []})
+            node["paths"].append(path)
+
+    def find(self, path):
+        node = self.root
+        for part in reversed(os.path.normpath(path).split(os.sep)):
+            node = node["children"].get(part)
+            if node is None:
+                return []
+        return list(node["paths"])
@@ -0,0 +1,156 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config.constants as constants
+
+# The source helpers load the tree-sitter Java grammar at import time; tests that need it are skipped
+# unless TREE_SITTER_JAVA_LIB points at a built grammar library.
+if os.environ.get("TREE_SITTER_JAVA_LIB"):
+    constants.TREE_SITTER_JAVA_LIB = os.environ["TREE_SITTER_JAVA_LIB"]
+
+JAVA_FILES = {
+    "src/main/java/p/Calc.java": """package p;
+
+public class Calc {
+    private int total;
+
+    public Calc() {
+        total = 0;
+    }
+
+    public int add(int a, int b) {
+        int sum = a + b;
+        return sum + 1;
+    }
+
+    public int sub(int a, int b) {
+        return a - b;
+    }
+}
+""",
+    # Hidden is package-private and declared in a file named after another class.
+    "src/main/java/p/Visible.java": """package p;
+
+public class Visible {
+    public int get() {
+        return Hidden.value();
+    }
+}
+
+class Hidden {
+    static int value() {
+        return 1;
+    }
+}
+""",
+    "src/main/java/p/Util.java": """package p;
+
+public class Util {
+    static int one() { return 1; }
+    static int two() { return 2; }
+}
+""",
+    "src/test/java/p/CalcTest.java": """package p;
+
+public class CalcTest {
+    public void testAdd() {
+        assertEquals(3, new Calc().add(1, 2));
+    }
+
+    public void testSub() {
+        assertEquals(1, new Calc().sub(2, 1));
+    }
+}
+""",
+}
+TRIGGER_TESTS = ["p.CalcTest::testAdd", "p.CalcTest::testSub"]
+COVERAGE = {
+    "p.CalcTest::testAdd": {"src_cov": {"p.Calc": [7, 11, 12], "p.Visible": [5], "p.Hidden": [11],
+                                        "p.Util": [4]},
+                            "test_cov": {"p.CalcTest": [5]}},
+    "p.CalcTest::testSub": {"src_cov": {"p.Calc": [7, 16]}, "test_cov": {"p.CalcTest": [9]}},
+}
+
+
+def write_coverage(cov_dir):
+    for test, kinds in COVERAGE.items():
+        for kind, classes in kinds.items():
+            os.makedirs(os.path.join(cov_dir, "Lang_1", kind), exist_ok=True)
+            entries = [{"class_name": class_name, "rest": "", "line_number": str(line)}
+                       for class_name, lines in classes.items() for line in lines]
+            with open(os.path.join(cov_dir, "Lang_1", kind, test), "w") as f:
+                json.dump(entries, f)
+
+
+@pytest.fixture
+def java_project(tmp_path, monkeypatch):
+    """A two-class Java checkout of bug Lang-1 with JSON coverage for two failing tests."""
+    if not constants.TREE_SITTER_JAVA_LIB:
+        pytest.skip("TREE_SITTER_JAVA_LIB is not set")
+    import src.dataset.coverage_store as coverage_store
+    import src.task as task
+
+    codebase_path = tmp_path / "codebase"
+    for path, source in JAVA_FILES.items():
+        (codebase_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (codebase_path / path).write_text(source)
+    write_coverage(str(tmp_path / "cov"))
+    monkeypatch.setattr(coverage_store, "covered_info_d4j_1_2", str(tmp_path / "cov"))
+    monkeypatch.setattr(coverage_store, "covered_info_columnar", "")
+    monkeypatch.setattr(task, "parse_cache_base", str(tmp_path / "parse_cache"))
+    return SimpleNamespace(codebase_path=str(codebase_path), parsed_dir=str(tmp_path / "parsed"),
+                           parse_cache=str(tmp_path / "parse_cache"), bug_id="Lang-1", trigger_tests=TRIGGER_TESTS,
+                           trigger_test_info={"src": JAVA_FILES["src/test/java/p/CalcTest.java"],
+                                              "path": "src/test/java/p/CalcTest.java",
+                                              "clean_error_info": "expected:<3> but was:<4>"})
+
+
+def load_codebase(project, lazy=False):
+    """Load the codebase of `java_project` the way `src.task.run` does."""
+    from src.codebase import CodeBase
+    from src.parse.parse_repo import process_java_files
+
+    index_path = os.path.join(project.parsed_dir, project.bug_id, "index.bin")
+    codebase = CodeBase(project.codebase_path, index_path)
+    if lazy:
+        codebase.read_covered_info("Lang", "1", project.trigger_tests[0])
+        codebase.load_parsed_files(lazy=True, cache_dir=project.parse_cache)
+    else:
+        process_java_files(project.codebase_path, index_path, quiet=True, cache_dir=project.parse_cache)
+        codebase.load_parsed_files()
+        codebase.read_covered_info("Lang", "1", project.trigger_tests[0])
+    codebase.read_trigger_tests_coverage("Lang", "1", project.trigger_tests)
+    return codebase
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    """The local chat completions stand-in, with `Model` pointed at it for the whole session."""
+    if not constants.TREE_SITTER_JAVA_LIB:
+        pytest.skip("TREE_SITTER_JAVA_LIB is not set")
+    from src.models.GPT import Model
+    from src.models.stub_server import start_stub_server
+
+    server = start_stub_server(port=0)
+    base_url = Model.base_url
+    Model.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    yield server
+    Model.base_url = base_url
+    server.shutdown()
+
+
+def run_args(project, output_dir):
+    """Positional arguments of `src.task.run` for the bug of `java_project`."""
+    os.makedirs(output_dir, exist_ok=True)
+    return (project.parsed_dir, 2, 0.2, "gpt-4o-mini", project.bug_id, str(output_dir), project.trigger_test_info,
+            project.codebase_path, project.trigger_tests[0])
+
+
+def run_kwargs(project):
+    return dict(advanced_identification=True, re_check=True, partial_save=True, trigger_tests=project.trigger_tests)
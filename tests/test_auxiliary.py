@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+import config.constants as constants
+
+if not constants.TREE_SITTER_JAVA_LIB:
+    pytest.skip("TREE_SITTER_JAVA_LIB is not set", allow_module_level=True)
+
+import src.tools.auxiliary as auxiliary
+from src.tools.auxiliary import ParsedFileCache, extract_children_from_class, get_parser
+
+
+def test_each_thread_gets_its_own_parser():
+    parsers = []
+    threads = [threading.Thread(target=lambda: parsers.append(get_parser())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert get_parser() is get_parser()
+    assert len({id(parser) for parser in parsers + [get_parser()]}) == 5
+
+
+def test_class_helpers_from_many_threads():
+    source = ("class A {\n" + "".join(f"    int m{i}() {{ return {i}; }}\n" for i in range(50)) + "}\n").encode()
+    expected = extract_children_from_class("A.java", source, 0)
+    results = []
+
+    def extract():
+        for _ in range(20):
+            results.append(extract_children_from_class("A.java", source, 0))
+
+    threads = [threading.Thread(target=extract) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(expected["methods_signature_list"]) == 50
+    assert len(results) == 160
+    assert all(result == expected for result in results)
+
+
+def test_parsed_file_cache_parses_outside_its_lock(tmp_path, monkeypatch):
+    for name in ["Slow", "Fast"]:
+        (tmp_path / f"{name}.java").write_text(f"class {name} {{}}\n")
+    cache = ParsedFileCache()
+    slow_started, release_slow = threading.Event(), threading.Event()
+
+    class Parser:
+        def parse(self, code):
+            if b"Slow" in code:
+                slow_started.set()
+                release_slow.wait(5)
+            return code
+
+    monkeypatch.setattr(auxiliary, "get_parser", Parser)
+    slow = threading.Thread(target=cache.get, args=(str(tmp_path / "Slow.java"),))
+    slow.start()
+    assert slow_started.wait(5)
+
+    # another thread's miss completes while the first parse is still running
+    assert cache.get(str(tmp_path / "Fast.java")) == (b"class Fast {}\n", b"class Fast {}\n")
+    release_slow.set()
+    slow.join()
+    assert cache.stats()["files"] == 2
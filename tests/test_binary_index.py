@@ -0,0 +1,26 @@
+import os
+from array import array
+
+from src.parse.binary_index import ColumnarFile, StringTable, write_columns
+
+MAGIC = b"TEST"
+
+
+def write_values(path, values):
+    strings = StringTable()
+    write_columns(str(path), MAGIC, 1, {"values": array("i", values)}, strings, header={"name": strings.intern("x")})
+
+
+def test_rewrite_does_not_change_a_mapped_file(tmp_path):
+    path = tmp_path / "index.bin"
+    write_values(path, [1, 2, 3])
+    reader = ColumnarFile(str(path), MAGIC, 1)
+
+    write_values(path, list(range(1000)))
+
+    assert list(reader._columns["values"]) == [1, 2, 3]
+    reader.close()
+    reader = ColumnarFile(str(path), MAGIC, 1)
+    assert len(reader._columns["values"]) == 1000
+    reader.close()
+    assert os.listdir(tmp_path) == ["index.bin"]
@@ -0,0 +1,139 @@
+import os
+
+import pytest
+
+from tests.conftest import load_codebase
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_suspicious_methods_skips_files_missing_from_index(java_project, lazy):
+    codebase = load_codebase(java_project, lazy)
+    # p.Hidden is covered, but no file src/main/java/p/Hidden.java exists
+    assert "src/main/java/p/Hidden.java" in codebase.coverage_matrix_src_files
+
+    result = codebase.get_suspicious_methods()
+
+    assert result.startswith("Result of get_suspicious_methods():\n(1) <file>src/main/java/p/Calc.java</file>")
+    assert "Hidden.java" not in result
+    assert "<class>Visible</class> <method_signature>get()</method_signature>" in result
+
+
+def test_class_info_lists_methods_covered_on_their_own_line(java_project):
+    codebase = load_codebase(java_project)
+
+    result = codebase.get_class_info("Util", "src/main/java/p/Util.java")
+
+    assert "one()" in result
+    assert "two()" not in result
+
+
+def test_class_children_have_the_file_line_numbers(java_project):
+    codebase = load_codebase(java_project)
+
+    codebase.get_class_info_from_file("Calc", "src/main/java/p/Calc.java")
+
+    [calc] = codebase.extract_classes_info
+    assert [(method["signature"], method["start_line"], method["end_line"])
+            for method in calc["methods_signature_list"]] == [("Calc()", 6, 8), ("add(int, int)", 10, 13),
+                                                              ("sub(int, int)", 15, 17)]
+
+
+def test_covered_entity_table_is_reused_until_the_coverage_changes(java_project, tmp_path, monkeypatch):
+    from src.coverage import CoveredEntityTable
+
+    table_path = str(tmp_path / "covered_entities" / "testAdd.json")
+    codebase = load_codebase(java_project)
+    codebase.load_covered_entities(table_path)
+    counts = {(e["type"], e["name"]): e["covered_lines"] for e in codebase.covered_entities.entities
+              if e["file"] == "src/main/java/p/Calc.java"}
+    assert counts == {("class", "Calc"): 3, ("constructor", "Calc"): 1, ("method", "add"): 2, ("method", "sub"): 0}
+
+    def build(*args):
+        raise AssertionError("rebuilt")
+
+    reloaded = load_codebase(java_project)
+    with monkeypatch.context() as m:
+        m.setattr(CoveredEntityTable, "build", build)
+        reloaded.load_covered_entities(table_path)
+    assert reloaded.covered_entities.entities == codebase.covered_entities.entities
+
+    reloaded.read_covered_info("Lang", "1", "p.CalcTest::testSub")
+    reloaded.load_covered_entities(table_path)
+    assert reloaded.covered_entities.covered_count("src/main/java/p/Calc.java", 15, 17) == 1
+    assert CoveredEntityTable.load(table_path).fingerprint == reloaded.covered_entities.fingerprint
+
+
+def test_class_and_file_listings_answer_from_the_covered_entity_table(java_project, monkeypatch):
+    codebase = load_codebase(java_project)
+    monkeypatch.setattr(codebase, "has_covered_lines", None)
+
+    result = codebase.get_class_info("Calc", "src/main/java/p/Calc.java")
+    assert "add(int, int)" in result and "sub(int, int)" not in result
+
+    result = codebase.get_files_from_dir("src/main/java/p")
+    assert result.splitlines()[1:] == ["src/main/java/p/Calc.java", "src/main/java/p/Util.java",
+                                       "src/main/java/p/Visible.java"]
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_symbol_tables_answer_class_and_method_lookups(java_project, lazy):
+    codebase = load_codebase(java_project, lazy)
+
+    assert codebase.lookup_class_files("Hidden") == ["src/main/java/p/Visible.java"]
+    [add] = codebase.lookup_class_methods("Calc", "add")
+    assert (add["file"], add["start_line"], add["end_line"], add["signature"]) == \
+           ("src/main/java/p/Calc.java", 10, 13, "add(int, int)")
+    assert [(m["type"], m["parent_name"]) for m in codebase.lookup_methods("Calc")] == [("constructor", "Calc")]
+    assert codebase.lookup_methods("missing") == []
+
+
+def test_find_path_resolves_partial_paths(java_project):
+    codebase = load_codebase(java_project)
+
+    assert codebase.find_path("src/main/java/p/Util.java") == ["src/main/java/p/Util.java"]
+    assert codebase.find_path(" p/Util.java") == ["src/main/java/p/Util.java"]
+    assert codebase.find_path("q/Util.java") == []
+
+
+def test_covered_class_files_are_resolved_once(java_project, monkeypatch):
+    import src.codebase
+
+    codebase = load_codebase(java_project)
+    assert codebase.class_file_names[("p.Calc", "main")] == "src/main/java/p/Calc.java"
+
+    def resolve(*args):
+        raise AssertionError("resolved again")
+
+    monkeypatch.setattr(src.codebase, "get_file_name", resolve)
+    monkeypatch.setattr(src.codebase, "recognize_pattern", resolve)
+    codebase.read_covered_info("Lang", "1", "p.CalcTest::testSub")
+    assert list(codebase.covered_line_src) == ["src/main/java/p/Calc.java"]
+    assert list(codebase.covered_line_src["src/main/java/p/Calc.java"]) == [7, 16]
+
+
+def test_lazy_load_parses_covered_files_first(java_project):
+    extra = os.path.join(java_project.codebase_path, "src/main/java/q/Extra.java")
+    os.makedirs(os.path.dirname(extra))
+    with open(extra, "w") as f:
+        f.write("package q;\n\npublic class Extra {\n    void run() {}\n}\n")
+
+    codebase = load_codebase(java_project, lazy=True)
+    assert codebase.pending_files == {"src/main/java/q/Extra.java"}
+    assert not os.path.exists(codebase.index_path)
+
+    assert codebase.lookup_class_files("Extra") == ["src/main/java/q/Extra.java"]
+    assert codebase.pending_files == set()
+    assert [m["file"] for m in codebase.lookup_methods("run")] == ["src/main/java/q/Extra.java"]
+
+
+def test_trigger_tests_coverage_matrix(java_project):
+    codebase = load_codebase(java_project)
+    codebase.read_trigger_tests_coverage("Lang", "1", java_project.trigger_tests + ["p.CalcTest::testMissing"])
+
+    matrix = codebase.coverage_matrix
+    assert matrix.tests == java_project.trigger_tests
+    assert matrix.union("src/main/java/p/Calc.java").tolist() == [7, 11, 12, 16]
+    assert matrix.intersection("src/main/java/p/Calc.java").tolist() == [7]
+    assert matrix.tests_covering("src/main/java/p/Calc.java", 15, 17) == 1
+    assert "src/test/java/p/CalcTest.java" in matrix
+    assert "src/test/java/p/CalcTest.java" not in codebase.coverage_matrix_src_files
@@ -0,0 +1,31 @@
+from src.coverage import CoverageMatrix, FileCoverage
+
+
+def test_file_coverage_range_queries():
+    coverage = FileCoverage([12, 5, 9, 5, 1000000])
+
+    assert coverage.count == 5
+    assert list(coverage) == [5, 9, 12, 1000000]
+    assert coverage.lines_in_range(6, 12) == [9, 12]
+    assert coverage.count_in_range(1, 9) == 2
+    assert coverage.any_in_range(5, 5)
+    assert coverage.any_in_range(10, 12)
+    assert coverage.any_in_range(999999, 2000000)
+    assert not coverage.any_in_range(6, 8)
+    assert not coverage.any_in_range(13, 999999)
+    assert not coverage.any_in_range(12, 10)
+    assert not FileCoverage([]).any_in_range(1, 10)
+
+
+def test_coverage_matrix_set_operations():
+    matrix = CoverageMatrix(["t1", "t2", "t3"], {"A.java": [[3, 5, 9], [5, 9], [9, 20]], "B.java": [[1], [], []]})
+
+    assert matrix.union("A.java").tolist() == [3, 5, 9, 20]
+    assert matrix.union("A.java", 4, 10).tolist() == [5, 9]
+    assert matrix.intersection("A.java").tolist() == [9]
+    lines, counts = matrix.failing_counts("A.java")
+    assert dict(zip(lines.tolist(), counts.tolist())) == {3: 1, 5: 2, 9: 3, 20: 1}
+    assert matrix.tests_covering("A.java", 1, 5) == 2
+    assert matrix.tests_covering("B.java", 1, 5) == 1
+    assert matrix.intersection("B.java").tolist() == []
+    assert matrix.union("C.java").tolist() == [] and matrix.tests_covering("C.java", 1, 5) == 0
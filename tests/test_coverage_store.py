@@ -0,0 +1,44 @@
+import json
+import os
+
+import src.dataset.coverage_store as coverage_store
+from src.dataset.coverage_store import CoverageFile, convert_bug_coverage, read_class_lines
+
+COVERAGE = {
+    "src_cov": {"p.CalcTest::testAdd": [("p.Calc", "add(II)I", 11), ("p.Calc", "add(II)I", 12),
+                                        ("p.Util", "one()I", 4)],
+                "p.CalcTest::testSub": [("p.Calc", "sub(II)I", 16)]},
+    "test_cov": {"p.CalcTest::testAdd": [("p.CalcTest", "testAdd()V", 5)]},
+}
+
+
+def write_json_coverage(bug_dir):
+    for kind, tests in COVERAGE.items():
+        os.makedirs(os.path.join(bug_dir, kind))
+        for test, entries in tests.items():
+            with open(os.path.join(bug_dir, kind, test), "w") as f:
+                json.dump([{"class_name": class_name, "rest": f"{method}:{line}", "line_number": str(line)}
+                           for class_name, method, line in entries], f)
+
+
+def test_columnar_store_returns_the_json_coverage(tmp_path, monkeypatch):
+    write_json_coverage(str(tmp_path / "cov" / "Lang_1"))
+    monkeypatch.setattr(coverage_store, "covered_info_d4j_1_2", str(tmp_path / "cov"))
+    monkeypatch.setattr(coverage_store, "covered_info_columnar", str(tmp_path / "cov_columnar"))
+    from_json = {(kind, test): read_class_lines("Lang", "1", kind, test)
+                 for kind, tests in COVERAGE.items() for test in tests}
+
+    convert_bug_coverage(str(tmp_path / "cov" / "Lang_1"), coverage_store.columnar_coverage_path("Lang", "1"))
+    coverage = CoverageFile(coverage_store.columnar_coverage_path("Lang", "1"))
+    for kind, tests in COVERAGE.items():
+        for test in tests:
+            with open(tmp_path / "cov" / "Lang_1" / kind / test, "r") as f:
+                assert coverage.entries(kind, test) == json.load(f)
+    assert not coverage.has_test("test_cov", "p.CalcTest::testSub")
+    coverage.close()
+
+    # the JSON files are no longer read once the bug is converted
+    monkeypatch.setattr(coverage_store, "covered_info_d4j_1_2", str(tmp_path / "missing"))
+    assert {(kind, test): read_class_lines("Lang", "1", kind, test)
+            for kind, tests in COVERAGE.items() for test in tests} == from_json
+    assert from_json[("src_cov", "p.CalcTest::testAdd")] == {"p.Calc": [11, 12], "p.Util": [4]}
@@ -0,0 +1,27 @@
+from src.message import MessageRecord, tool_output_stub
+from src.models.tokenizer import count_message_tokens
+
+
+def add_round(record, call_id, output):
+    record.messages.append({"role": "assistant", "content": None, "tool_calls": [
+        {"id": call_id, "type": "function", "function": {"name": "get_class_info", "arguments": "{}"}}]})
+    record.add_tool_res(output, call_id)
+
+
+def test_each_compacted_output_is_counted_once():
+    record = MessageRecord(tool_output_budget=10)
+    record.add_msg("user", "Find the bug.")
+    output = "class A {}\n" + "int x;\n" * 500
+    add_round(record, "call_1", output)
+    record.get_call_msgs()
+    assert record.tokens_saved == 0
+
+    add_round(record, "call_2", output)
+    for _ in range(3):
+        messages = record.get_call_msgs()
+    assert messages[2]["content"].startswith("[The output of get_class_info({})")
+
+    function = {"name": "get_class_info", "arguments": "{}"}
+    stub = {"role": "tool", "content": tool_output_stub(output, function), "tool_call_id": "call_1"}
+    assert record.tokens_saved == count_message_tokens(record.messages[2], "gpt-4o-mini") \
+        - count_message_tokens(stub, "gpt-4o-mini")
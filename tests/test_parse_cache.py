@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from src.parse.parse_cache import cache_entry_path, content_key, load_cached_parse, store_cached_parse
+
+
+def test_failed_store_leaves_no_temp_file(tmp_path):
+    key = content_key(b"class A {}")
+    with pytest.raises(TypeError):
+        store_cached_parse(str(tmp_path), key, {"entities": [object()]})
+
+    entry_dir = os.path.dirname(cache_entry_path(str(tmp_path), key))
+    assert os.listdir(entry_dir) == []
+    assert load_cached_parse(str(tmp_path), key) is None
+
+    store_cached_parse(str(tmp_path), key, {"entities": [], "encoding": "utf-8"})
+    assert os.listdir(entry_dir) == [key + ".json"]
+    assert load_cached_parse(str(tmp_path), key) == {"entities": [], "encoding": "utf-8"}
@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import config.constants as constants
+
+if not constants.TREE_SITTER_JAVA_LIB:
+    pytest.skip("TREE_SITTER_JAVA_LIB is not set", allow_module_level=True)
+
+from src.parse.binary_index import BinaryIndex
+from src.parse.parse_cache import cache_entry_path
+from src.parse.parse_repo import index_java_file, list_java_files, parse_java_source, process_java_files
+
+
+def build_index(project, name="index.bin", **kwargs):
+    index_path = os.path.join(project.parsed_dir, name)
+    process_java_files(project.codebase_path, index_path, quiet=True, **kwargs)
+    return BinaryIndex(index_path)
+
+
+def test_one_pass_indexes_entities_and_class_names(java_project):
+    index = build_index(java_project)
+
+    assert os.listdir(java_project.parsed_dir) == ["index.bin"]
+    assert index.file_paths == list_java_files(java_project.codebase_path)
+    assert [row[:5] for row in index.file_entity_rows("src/main/java/p/Calc.java")] == [
+        ("class", "Calc", 3, 18, -1), ("constructor", "Calc", 6, 8, 0), ("method", "add", 10, 13, 0),
+        ("method", "sub", 15, 17, 0)]
+    assert index.class_names("src/main/java/p/Visible.java") == ["Visible", "Hidden"]
+    index.close()
+
+
+def test_parse_cache_entry_holds_entities_and_encoding(java_project):
+    key, encoding, entities, hit = index_java_file(java_project.codebase_path, "src/main/java/p/Calc.java",
+                                                   cache_dir=java_project.parse_cache)
+    assert not hit
+
+    with open(cache_entry_path(java_project.parse_cache, key), "r") as f:
+        assert json.load(f) == {"entities": entities, "encoding": "utf-8"}
+    assert index_java_file(java_project.codebase_path, "src/main/java/p/Calc.java",
+                           cache_dir=java_project.parse_cache) == (key, encoding, entities, True)
+
+
+def test_process_pool_index_matches_serial_index(java_project):
+    serial = build_index(java_project)
+    parallel = build_index(java_project, "parallel.bin", workers=2)
+
+    assert parallel.file_paths == serial.file_paths
+    for file in serial.file_paths:
+        assert parallel.file_entity_rows(file) == serial.file_entity_rows(file)
+    assert list(parallel.content_encodings()) == list(serial.content_encodings())
+    serial.close()
+    parallel.close()
+
+
+def test_parse_cache_is_shared_across_checkouts(java_project, tmp_path):
+    build_index(java_project, cache_dir=java_project.parse_cache)
+    other = str(tmp_path / "other_checkout")
+    shutil.copytree(java_project.codebase_path, other)
+    with open(os.path.join(other, "src/main/java/p/Util.java"), "a") as f:
+        f.write("// edited\n")
+
+    hits = {file: index_java_file(other, file, cache_dir=java_project.parse_cache)[3]
+            for file in list_java_files(other)}
+
+    assert hits == {"src/test/java/p/CalcTest.java": True, "src/main/java/p/Calc.java": True,
+                    "src/main/java/p/Util.java": False, "src/main/java/p/Visible.java": True}
+
+
+def test_method_records_carry_signature_javadoc_and_byte_range():
+    code = b"""class A {
+    /** Adds two numbers. */
+    // not javadoc
+    public <T> int add(int a, java.util.List<T> b) { return a; }
+
+    int plain() { return 0; }
+}
+"""
+    [cls] = parse_java_source(code)
+    add, plain = cls["children"]
+
+    assert add["signature"] == "add(int, java.util.List<T>)"
+    assert add["comment"] == "/** Adds two numbers. */"
+    assert code[add["start_byte"]:add["end_byte"]].startswith(b"public <T> int add(")
+    assert (add["start_line"], add["end_line"]) == (4, 4)
+    assert plain["signature"] == "plain()" and plain["comment"] == ""
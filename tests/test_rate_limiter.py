@@ -0,0 +1,28 @@
+import asyncio
+import fcntl
+
+from src.models.rate_limiter import RateLimiter
+
+
+def test_acquire_async_waits_for_the_state_file_off_the_event_loop(tmp_path):
+    limiter = RateLimiter(rpm=60, tpm=1000, state_path=str(tmp_path / "rate_limit.json"))
+
+    async def main():
+        ticks = 0
+        with open(limiter.state_path, "a+") as f:
+            # another process holds the shared budget
+            fcntl.flock(f, fcntl.LOCK_EX)
+            acquire = asyncio.ensure_future(limiter.acquire_async(100))
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert not acquire.done()
+        reserved = await acquire
+        await limiter.settle_async(reserved, 40)
+        return ticks, reserved
+
+    ticks, reserved = asyncio.run(main())
+
+    assert (ticks, reserved) == (5, 100)
+    state = limiter._update(lambda state: dict(state))
+    assert state["requests"] < 60 and 950 <= state["tokens"] < 1000
@@ -0,0 +1,47 @@
+from openai.types.chat import ChatCompletion
+
+from src.models.GPT import Model
+from src.models.response_cache import ResponseCache, request_key
+
+
+def completion(content):
+    return ChatCompletion.model_validate({
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    })
+
+
+def test_reask_replays_its_own_answer(tmp_path, monkeypatch):
+    import src.models.GPT as GPT
+
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), "readwrite")
+    monkeypatch.setattr(GPT, "response_cache", cache)
+    params = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Locate the bug."}]}
+
+    recording = Model()
+    for answer in ["{}", '{"bug_locations": []}']:
+        key, stored = recording.cached_response(params)
+        assert stored is None
+        recording.store_response(key, completion(answer))
+
+    replay = Model()
+    answers = [replay.cached_response(params)[1].choices[0].message.content for _ in range(2)]
+    assert answers == ["{}", '{"bug_locations": []}']
+    assert replay.cached_response(params)[1] is None
+
+
+def test_running_size_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), "readwrite")
+    size = len(completion("a").model_dump_json())
+    cache.max_bytes = 2 * size
+    for content in "abc":
+        cache.put(request_key({"messages": content}), completion(content))
+
+    assert cache.get(request_key({"messages": "a"})) is None
+    assert cache.get(request_key({"messages": "c"})).choices[0].message.content == "c"
+    assert cache._size == 2 * size
+
+    reopened = ResponseCache(cache.path, "readwrite")
+    reopened._connect()
+    assert reopened._size == cache._size
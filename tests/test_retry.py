@@ -0,0 +1,58 @@
+import email.utils
+import time
+
+import httpx
+import openai
+import pytest
+
+from src.models.retry import RetryPolicy, retry_after
+
+
+def status_error(status, headers=None):
+    request = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return openai.APIStatusError("error", response=response, body=None)
+
+
+def test_retry_after_headers():
+    assert retry_after(status_error(429, {"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(status_error(429, {"retry-after": "7"})) == 7.0
+    date = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= retry_after(status_error(429, {"retry-after": date})) <= 30
+    assert retry_after(status_error(429)) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_retry_policy_backoff_and_limits():
+    policy = RetryPolicy(max_retries=3, base_delay=1.0, max_delay=4.0, budget=10.0)
+
+    assert policy.delay(0, status_error(429, {"retry-after": "2"}), 0) == 2.0
+    for retries in range(3):
+        assert 0 <= policy.delay(retries, status_error(503), 0) <= min(4.0, 2 ** retries)
+    assert policy.delay(3, status_error(503), 0) is None
+    assert policy.delay(0, status_error(400), 0) is None
+    assert policy.delay(0, ValueError("bug"), 0) is None
+    assert policy.delay(0, status_error(429, {"retry-after": "5"}), 6.0) is None
+    request = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+    assert policy.delay(0, openai.APITimeoutError(request), 0) is not None
+
+
+@pytest.mark.parametrize("status, attempts", [(429, 3), (400, 1)])
+def test_model_retries_transient_errors(monkeypatch, status, attempts):
+    from src.models.GPT import Model
+    from src.models.retry import retry_policy
+    from src.models.stub_server import start_stub_server
+
+    server = start_stub_server(port=0, script=[{"error": status}])
+    monkeypatch.setattr(Model, "base_url", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(retry_policy, "max_retries", 2)
+    model = Model()
+    model.initial_model_config("gpt-4o-mini")
+    try:
+        with pytest.raises(openai.APIStatusError):
+            model.call([{"role": "user", "content": "Find the bug."}])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert server.backend.requests == attempts
@@ -0,0 +1,86 @@
+import json
+import time
+
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta
+from openai.types.completion_usage import CompletionUsage
+
+from src.models.streaming import JsonObjectScanner, StreamCollector
+
+
+def chunk(content=None, finish_reason=None, usage=None):
+    choices = [] if usage is not None else [Choice(index=0, delta=ChoiceDelta(content=content),
+                                                   finish_reason=finish_reason)]
+    return ChatCompletionChunk(id="chatcmpl-1", object="chat.completion.chunk", created=0, model="gpt-4o-mini",
+                               choices=choices, usage=usage)
+
+
+def feed(parts):
+    scanner = JsonObjectScanner()
+    for part in parts:
+        scanner.feed(part)
+    return scanner
+
+
+def test_scanner_follows_strings_and_nesting_across_chunks():
+    text = '  {"a": "}{\\"]", "b": [1, {"c": []}]}'
+    scanner = feed([text[i:i + 3] for i in range(0, len(text), 3)])
+    assert (scanner.state, scanner.end, scanner.extra) == ("closed", len(text), False)
+
+    assert feed(['{"a": [1, ', '2]']).state == "open"
+    assert feed(["\n ", "Sure, here it is"]).state == "invalid"
+    scanner = feed(['{"a": 1}', "  ", "\nmore"])
+    assert scanner.extra and scanner.end == len('{"a": 1}')
+
+
+def test_collector_stops_after_the_object_and_drops_the_rest():
+    collector = StreamCollector(time.time(), prompt_tokens_estimate=50)
+    assert not collector.add(chunk('{"bug_locations": '))
+    assert not collector.add(chunk('[{"file": "A.java"}]}'))
+    assert not collector.add(chunk("\n"))
+    assert collector.add(chunk(" And some explanation."))
+
+    completion = collector.completion()
+    assert json.loads(completion.choices[0].message.content) == {"bug_locations": [{"file": "A.java"}]}
+    # Cut before the usage chunk: the prompt is estimated and each content chunk counts as a token.
+    assert (completion.usage.prompt_tokens, completion.usage.completion_tokens) == (50, 4)
+    metrics = collector.metrics()
+    assert metrics["early_stop"] and metrics["time_to_first_token"] is not None
+
+
+def test_collector_reads_a_complete_stream_to_its_usage():
+    collector = StreamCollector(time.time(), prompt_tokens_estimate=50)
+    for part in chunk('{"ranked_methods": '), chunk("[]}"), chunk(finish_reason="stop"), \
+            chunk(usage=CompletionUsage(prompt_tokens=120, completion_tokens=6, total_tokens=126)):
+        assert not collector.add(part)
+
+    completion = collector.completion()
+    assert completion.choices[0].message.content == '{"ranked_methods": []}'
+    assert completion.usage.prompt_tokens == 120
+    assert not collector.metrics()["early_stop"]
+
+
+def test_collector_gives_up_on_an_answer_that_is_not_an_object():
+    collector = StreamCollector(time.time(), prompt_tokens_estimate=50)
+    assert collector.add(chunk("I could not find the bug."))
+    assert collector.completion().choices[0].message.content == "I could not find the bug."
+
+
+def test_model_streams_json_answers(monkeypatch):
+    from src.models.GPT import Model
+    from src.models.stub_server import start_stub_server
+
+    server = start_stub_server(port=0, script=[{"content": '{"ranked_methods": [{"index": 1}]} Hope this helps!'}])
+    monkeypatch.setattr(Model, "base_url", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    monkeypatch.setattr(Model, "stream_json", True)
+    model = Model()
+    model.initial_model_config("gpt-4o-mini")
+    try:
+        response_dict, *_ = model.call([{"role": "user", "content": "Rank them."}],
+                                       response_format="json_object")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert response_dict == {"ranked_methods": [{"index": 1}]}
+    assert model.last_call_metrics["streamed"] and model.last_call_metrics["early_stop"]
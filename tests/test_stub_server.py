@@ -0,0 +1,90 @@
+import json
+
+import openai
+import pytest
+from openai import OpenAI
+
+from src.models.response_cache import ResponseCache, request_key
+from src.models.stub_server import start_stub_server
+from tests.test_response_cache import completion
+
+SUSPICIOUS_OUTPUT = ("Result of get_suspicious_methods():\n(1) <file>src/main/java/p/Calc.java</file> <class>Calc</class> "
+                     "<method_signature>add(int a, int b)</method_signature>")
+TOOLS = [{"type": "function", "function": {"name": "get_suspicious_methods", "parameters": {"type": "object"}}}]
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(**backend_args):
+        server = start_stub_server(port=0, **backend_args)
+        servers.append(server)
+        return OpenAI(api_key="local", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", max_retries=0)
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def ask(client, content, **params):
+    return client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": content}],
+                                          **params)
+
+
+def test_default_answers_walk_the_pipeline(serve):
+    client = serve()
+
+    response = ask(client, "Find the bug.", tools=TOOLS)
+    assert response.choices[0].finish_reason == "tool_calls"
+    assert response.choices[0].message.tool_calls[0].function.name == "get_suspicious_methods"
+    assert response.usage.prompt_tokens > 0
+
+    messages = [{"role": "user", "content": "Find the bug."},
+                {"role": "assistant", "content": None, "tool_calls": [
+                    {"id": "call_1", "type": "function", "function": {"name": "get_suspicious_methods",
+                                                                       "arguments": "{}"}}]},
+                {"role": "tool", "tool_call_id": "call_1", "content": SUSPICIOUS_OUTPUT},
+                {"role": "user", "content": "Answer with the bug locations."}]
+    response = client.chat.completions.create(model="gpt-4o-mini", messages=messages,
+                                              response_format={"type": "json_object"})
+    answer = json.loads(response.choices[0].message.content)
+    assert answer["bug_locations"] == [{"file": "src/main/java/p/Calc.java", "class": "Calc",
+                                        "method": "add(int a, int b)",
+                                        "repair_advice": "Check the logic of this method."}]
+
+
+def test_streamed_answer_matches_the_plain_one(serve):
+    client = serve(script=[{"content": '{"ranked_methods": [{"index": 1, "level": 1}]}'}])
+
+    plain = ask(client, "Rank them.")
+    chunks = list(ask(client, "Rank them.", stream=True, stream_options={"include_usage": True}))
+
+    content = "".join(chunk.choices[0].delta.content or "" for chunk in chunks if chunk.choices)
+    assert content == plain.choices[0].message.content
+    assert chunks[-1].usage.total_tokens == plain.usage.total_tokens
+
+
+def test_script_rules_and_injected_errors(serve):
+    client = serve(script=[{"match": "slow down", "error": 429}, {"match": "^Hi", "content": "Hello."}])
+    with pytest.raises(openai.RateLimitError):
+        ask(client, "Please slow down.")
+    assert ask(client, "Hi there").choices[0].message.content == "Hello."
+
+    client = serve(error_rate=1.0, error_status=503, seed=0)
+    with pytest.raises(openai.InternalServerError):
+        ask(client, "Hi there")
+
+
+def test_recording_replays_each_repeat_of_a_request(serve, tmp_path):
+    body = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "Find the bug."}]}
+    recording = ResponseCache(str(tmp_path / "cache.sqlite"), "readwrite")
+    recording.put(request_key(body), completion("first"))
+    recording.put(request_key(body, 1), completion("second"))
+    client = serve(recording=recording.path)
+
+    answers = [ask(client, "Find the bug.").choices[0].message.content for _ in range(3)]
+
+    assert answers[:2] == ["first", "second"]
+    assert answers[2] != "second"
@@ -0,0 +1,72 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import config.constants as constants
+
+if not constants.TREE_SITTER_JAVA_LIB:
+    pytest.skip("TREE_SITTER_JAVA_LIB is not set", allow_module_level=True)
+
+from src.custom_signal import TaskMainNormalExit
+from src.models.GPT import Model
+from src.task import run, run_async
+from tests.conftest import run_args, run_kwargs
+
+BUG_OUTPUTS = ["Lang-1.json", "top-1.json", "sorted_methods.json", "root_cause.txt"]
+
+
+def read_outputs(output_dir):
+    outputs = {}
+    for name in BUG_OUTPUTS:
+        with open(os.path.join(output_dir, name), "r") as f:
+            outputs[name] = f.read()
+    return outputs
+
+
+def test_run_localizes_bug_against_stub_server(java_project, stub_server, tmp_path):
+    with pytest.raises(TaskMainNormalExit):
+        run(*run_args(java_project, tmp_path / "out"), model_class=Model, **run_kwargs(java_project))
+
+    with open(tmp_path / "out" / "top-1.json", "r") as f:
+        top_1 = json.load(f)
+    assert top_1["file"] == "src/main/java/p/Calc.java"
+    with open(tmp_path / "out" / "usage.json", "r") as f:
+        usage = json.load(f)
+    assert usage["total"]["calls"] > 0 and usage["total"]["input_tokens"] > 0
+
+
+def test_run_async_matches_sync_run(java_project, stub_server, tmp_path):
+    with pytest.raises(TaskMainNormalExit):
+        run(*run_args(java_project, tmp_path / "sync"), model_class=Model, **run_kwargs(java_project))
+
+    async def run_concurrently():
+        return await asyncio.gather(*[run_async(*run_args(java_project, tmp_path / f"async_{i}"),
+                                                **run_kwargs(java_project)) for i in range(3)],
+                                    return_exceptions=True)
+
+    results = asyncio.run(run_concurrently())
+
+    assert all(isinstance(result, TaskMainNormalExit) for result in results)
+    expected = read_outputs(tmp_path / "sync")
+    for i in range(3):
+        assert read_outputs(tmp_path / f"async_{i}") == expected
+
+
+def test_run_leaves_no_bug_context_after_failure(java_project, stub_server, tmp_path):
+    from loguru import logger
+    from src.custom_signal import TaskMainErrorExit
+
+    args = list(run_args(java_project, tmp_path / "out"))
+    args[7] = str(tmp_path / "not_a_checkout")  # no source folders: run fails before the tool loop
+    # keep the traceback, and with it the frame of run, alive while logging
+    with pytest.raises(TaskMainErrorExit) as error:
+        run(*args, model_class=Model, **run_kwargs(java_project))
+
+    records = []
+    handler_id = logger.add(records.append, level="INFO")
+    logger.info("after the bug")
+    logger.remove(handler_id)
+    assert "bug_id" not in records[0].record["extra"]
+    assert error.value
@@ -0,0 +1,22 @@
+from types import SimpleNamespace
+
+import src.models.tokenizer as tokenizer
+
+
+def test_unavailable_encoding_is_estimated_and_logged_once(monkeypatch):
+    attempts, logged = [], []
+
+    def get_encoding(name):
+        attempts.append(name)
+        raise ConnectionError("no network")
+
+    monkeypatch.setattr(tokenizer, "tiktoken", SimpleNamespace(get_encoding=get_encoding))
+    monkeypatch.setattr(tokenizer, "_encodings", {})
+    monkeypatch.setattr(tokenizer, "print_and_log", logged.append)
+
+    assert tokenizer.count_text_tokens("a" * 30, "gpt-4o-mini") == 10
+    assert tokenizer.count_text_tokens("a" * 31, "gpt-4o-mini") == 11
+
+    assert attempts == ["o200k_base"]
+    assert len(logged) == 1 and "estimated from the text length" in logged[0]
+
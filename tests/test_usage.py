@@ -0,0 +1,51 @@
+import json
+import threading
+from types import SimpleNamespace
+
+from src.models.usage import USAGE_FILE, UsageTracker, cached_prompt_tokens, roll_up_usage
+
+
+def test_tracker_accounts_per_phase():
+    usage = UsageTracker()
+    usage.record("tool_loop", 100, 10, {"latency": 1.5, "cached_tokens": 64})
+    usage.record("tool_loop", 120, 20, {"latency": 0.5})
+    usage.record("ranking", 300, 30, {"latency": 2.0})
+    usage.record("ranking", 300, 30, {"latency": 0.0, "cached": True})
+
+    assert usage.phases["tool_loop"] == {"calls": 2, "input_tokens": 220, "output_tokens": 30, "cached_tokens": 64,
+                                         "replayed_calls": 0, "latency": 2.0}
+    assert usage.phases["ranking"]["calls"] == 2 and usage.phases["ranking"]["replayed_calls"] == 1
+    assert usage.phases["ranking"]["input_tokens"] == 300
+    assert usage.total()["input_tokens"] == 520 and usage.total()["calls"] == 4
+
+
+def test_cached_prompt_tokens():
+    assert cached_prompt_tokens(SimpleNamespace(prompt_tokens_details={"cached_tokens": 32})) == 32
+    assert cached_prompt_tokens(SimpleNamespace(prompt_tokens_details=SimpleNamespace(cached_tokens=16))) == 16
+    assert cached_prompt_tokens(SimpleNamespace()) == 0
+
+
+def test_concurrent_bugs_roll_up(tmp_path):
+    def run_bug(bug_id, calls):
+        usage = UsageTracker()
+        for _ in range(calls):
+            usage.record("location_proposal", 10, 1, {"latency": 0.1})
+            usage.record("self_check", 5, 1)
+        (tmp_path / bug_id).mkdir()
+        usage.save(tmp_path / bug_id)
+
+    threads = [threading.Thread(target=run_bug, args=(f"Lang-{i}", 100 * (i + 1))) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with open(tmp_path / "Lang-0" / USAGE_FILE, "r") as f:
+        assert json.load(f)["total"]["calls"] == 200
+    rollup = roll_up_usage(tmp_path)
+    assert rollup["bug_runs"] == 4
+    assert rollup["phases"]["location_proposal"]["calls"] == 1000
+    assert rollup["phases"]["location_proposal"]["input_tokens"] == 10000
+    assert rollup["total"]["input_tokens"] == 15000
+    # The rollup does not count itself when it runs again.
+    assert roll_up_usage(tmp_path)["bug_runs"] == 4
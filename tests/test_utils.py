@@ -0,0 +1,15 @@
+from src.tools.utils import PathSuffixTrie
+
+PATHS = ["src/main/java/p/Calc.java", "src/test/java/p/Calc.java", "src/main/java/q/Calc.java",
+         "src/main/java/p/Util.java"]
+
+
+def test_path_suffix_trie_matches_whole_trailing_components():
+    trie = PathSuffixTrie(PATHS)
+
+    assert trie.find("Calc.java") == PATHS[:3]
+    assert trie.find("p/Calc.java") == PATHS[:2]
+    assert trie.find("main/java/p/Calc.java") == PATHS[:1]
+    assert trie.find("./java/q/Calc.java") == PATHS[2:3]
+    assert trie.find("alc.java") == []
+    assert trie.find("r/Calc.java") == []